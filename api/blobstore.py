@@ -0,0 +1,61 @@
+# Content-addressed blob store for large task inputs and results.
+# Mirrored in worker/blobstore.py; both services mount the same BLOB_DIR volume.
+# Keys are SHA-256 hex digests, so identical payloads are stored once. The layout
+# (<dir>/ab/cd/<sha256>) maps one-to-one onto object keys in a MinIO/S3 bucket.
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+BLOB_DIR = os.getenv("BLOB_DIR", "/data/blobs")
+BLOB_THRESHOLD = int(os.getenv("BLOB_THRESHOLD", "65536")) # bytes; larger payloads are offloaded
+BLOB_PREVIEW_CHARS = int(os.getenv("BLOB_PREVIEW_CHARS", "256")) # kept inline in the row
+
+REF_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+def blob_path(ref: str) -> str:
+    if not REF_PATTERN.match(ref or ""):
+        raise ValueError(f"Invalid blob reference {ref!r}")
+    return os.path.join(BLOB_DIR, ref[:2], ref[2:4], ref)
+
+def put(data: bytes) -> str:
+    """Store data under its SHA-256 and return the reference; a no-op when it is already stored."""
+    ref = hashlib.sha256(data).hexdigest()
+    path = blob_path(ref)
+    if os.path.exists(path):
+        return ref
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write then rename, so readers never see a partial blob
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return ref
+
+def get(ref: str) -> bytes:
+    with open(blob_path(ref), "rb") as f:
+        return f.read()
+
+def size(ref: str) -> int:
+    return os.path.getsize(blob_path(ref))
+
+def preview(text: str) -> str:
+    return text[:BLOB_PREVIEW_CHARS] + "…"
+
+def offload(text: str):
+    """(value to keep in the row, blob reference or None) for a payload of any size."""
+    data = text.encode()
+    if len(data) <= BLOB_THRESHOLD:
+        return text, None
+    return preview(text), put(data)
+
+def clear():
+    """Remove every blob (admin system reset)."""
+    if os.path.isdir(BLOB_DIR):
+        for entry in os.listdir(BLOB_DIR):
+            shutil.rmtree(os.path.join(BLOB_DIR, entry), ignore_errors=True)
@@ -1,28 +1,50 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Header
+from fastapi import FastAPI, Depends, HTTPException, Header, Response, Request
+from fastapi.responses import StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from typing import Optional
-import redis
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import insert, update, delete, select, func, text, tuple_
+from pydantic import BaseModel, Field
+from typing import Optional, Literal
+import redis.asyncio as aioredis
+import asyncio
 import json
+import hashlib
+import math
 import os
 import datetime
+import time
 import jwt # pyjwt
-import bcrypt
-from database import engine, get_db, Base
+import multiprocessing
+from croniter import croniter
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from passwords import get_password_hash, verify_password
+from database import engine, async_engine, get_db, Base, AsyncSessionLocal, sync_schema
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+import metrics
 import models
+import blobstore
 
 # Create Tables
 Base.metadata.create_all(bind=engine)
+sync_schema()
 
 app = FastAPI(title="Reliable Job Runner API")
 
 # Password Hashing
-def get_password_hash(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+# bcrypt is CPU-bound (~100-300ms), so it runs in a bounded process pool instead of on the event loop
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+# forkserver: pool processes never fork this threaded process and its open DB/Redis pools
+password_pool = ProcessPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS,
+    mp_context=multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"),
+)
+
+async def hash_password_async(password):
+    return await asyncio.get_running_loop().run_in_executor(password_pool, get_password_hash, password)
 
-def verify_password(plain_password, hashed_password):
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+async def verify_password_async(plain_password, hashed_password):
+    return await asyncio.get_running_loop().run_in_executor(password_pool, verify_password, plain_password, hashed_password)
 
 # CORS
 app.add_middleware(
@@ -31,16 +53,134 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Content-Range", "Accept-Ranges", "Content-Disposition", "Idempotent-Replayed", "Retry-After"],
 )
 
+metrics.instrument_engine(async_engine.sync_engine)
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template so /tasks/1 and /tasks/2 share a series; unmatched paths collapse into one
+    route = request.scope.get("route")
+    metrics.REQUEST_SECONDS.labels(request.method, route.path if route else "unmatched", response.status_code).observe(
+        time.perf_counter() - started
+    )
+    return response
+
 # Redis Connection
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = os.getenv("REDIS_PORT", "6379")
-redis_client = redis.Redis(host=REDIS_HOST, port=int(REDIS_PORT), db=0, decode_responses=True)
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "200"))
+redis_client = aioredis.Redis(
+    host=REDIS_HOST, port=int(REDIS_PORT), db=0, decode_responses=True, max_connections=REDIS_MAX_CONNECTIONS
+)
+
+# Listing
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+CHANGES_OVERLAP = datetime.timedelta(seconds=float(os.getenv("CHANGES_OVERLAP", "2"))) # Re-send window for rows committed with an older NOW()
+STATUS_COUNTS_KEY = "status_counts:{}" # per owner ("all" unscoped), shared by every poller and API instance
+STATUS_COUNTS_TTL = int(os.getenv("STATUS_COUNTS_TTL", "2000")) # ms the counts may lag; at most one GROUP BY per scope per window
+
+# Quota
+QUOTA_RECONCILE_INTERVAL = int(os.getenv("QUOTA_RECONCILE_INTERVAL", "3600")) # seconds, 0 disables
+
+# Cancellation events, consumed by workers to interrupt running tasks
+CANCEL_CHANNEL = "task_cancellations"
+
+async def publish_cancellations(task_ids):
+    if task_ids:
+        await redis_client.publish(CANCEL_CHANNEL, json.dumps(task_ids))
+
+# Live task events: workers and the API publish status transitions, /tasks/stream fans them out
+TASK_EVENTS_CHANNEL = "task_events"
+STREAM_KEEPALIVE = 15 # seconds between SSE comments so proxies keep the connection open
+STREAM_QUEUE_SIZE = 1000 # per client; a slow client drops events and re-syncs via /tasks/changes
+
+# owner_id -> queues of the SSE clients connected to this API instance
+task_event_subscribers: dict[int, set[asyncio.Queue]] = {}
+
+def task_event(task_id, owner_id, task_status, result=None):
+    return json.dumps({"task_id": task_id, "owner_id": owner_id, "status": task_status, "result": result})
 
 # Security
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
 ALGORITHM = "HS256"
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+# token -> verified payload, LRU-evicted; entries are dropped once the token's exp passes
+token_cache: OrderedDict[str, dict] = OrderedDict()
+
+# Priority lanes: one stream per lane so big low-priority batches never queue ahead of small jobs
+LANE_STREAMS = {"high": "task_stream:high", "normal": "task_stream", "low": "task_stream:low"}
+GROUP_NAME = "task_workers" # Worker consumer group, read for queue metrics
+# Default lane per task_type when the client does not pick one, e.g. "video_gen=low,image_gen=low"
+TASK_TYPE_LANES = dict(
+    item.split("=", 1) for item in os.getenv("TASK_TYPE_LANES", "").split(",") if "=" in item
+)
+
+# Dead-letter stream, filled by workers with entries that exceeded MAX_DELIVERIES
+DLQ_KEY = "task_stream:dlq"
+MAX_DLQ_BATCH = int(os.getenv("MAX_DLQ_BATCH", "1000"))
+
+# Fair share: queue per owner and lane, released into the lane streams by worker/dispatcher.py
+FAIR_SHARE = os.getenv("FAIR_SHARE", "0") == "1"
+FAIR_QUEUE_KEY = "fair:{}:{}" # lane, owner_id
+FAIR_OWNERS_KEY = "fair:{}:owners" # lane
+FAIR_LIMITS_KEY = "fair:limits" # admin-configured per-user concurrency overrides, kept across resets
+
+# Scheduling: Scheduled tasks wait in a zset scored by run_at; worker/scheduler.py promotes them when due
+SCHEDULE_KEY = "schedule:due" # task_id -> run_at (epoch seconds)
+
+# Result cache, filled by workers (worker/result_cache.py)
+CACHE_LRU_KEY = "result_cache:lru"
+CACHE_STATS_KEY = "result_cache:stats"
+
+# Dispatch
+MAX_BULK_TASKS = int(os.getenv("MAX_BULK_TASKS", "5000")) # Total replicas per /tasks/bulk call
+# Embedded spec: stream entries carry what the worker needs to start, so it skips the initial SELECT
+EMBED_TASK_SPEC = os.getenv("EMBED_TASK_SPEC", "1") == "1"
+MAX_EMBEDDED_SPEC_BYTES = int(os.getenv("MAX_EMBEDDED_SPEC_BYTES", "4096")) # larger specs fall back to a DB read
+# Idempotency: a retried POST with the same Idempotency-Key gets the first response instead of new tasks
+IDEMPOTENCY_KEY = "idempotency:{}:{}" # user_id, client key -> {"fingerprint": ..., "response": [...]}
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400")) # seconds a key and its response are remembered
+IDEMPOTENCY_LOCK_TTL = int(os.getenv("IDEMPOTENCY_LOCK_TTL", "60")) # seconds a request in progress holds its key
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+# Admission control: while workers are this far behind, new dispatch gets 429 + Retry-After (0 disables a limit)
+ADMISSION_MAX_QUEUED = int(os.getenv("ADMISSION_MAX_QUEUED", "0")) # tasks waiting for a worker: group lag plus fair-share queues
+ADMISSION_MAX_PENDING = int(os.getenv("ADMISSION_MAX_PENDING", "0")) # entries delivered to workers but not yet ACKed
+ADMISSION_LOW_SHARE = float(os.getenv("ADMISSION_LOW_SHARE", "0.5")) # low-lane dispatch is shed from this share of the limits
+ADMISSION_REFRESH = float(os.getenv("ADMISSION_REFRESH", "1")) # seconds each API process reuses a queue depth reading
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "10")) # seconds shed clients are told to wait
+# Per-user token bucket over dispatched tasks, kept in Redis so the limit holds across API replicas (0 disables)
+RATE_LIMIT_KEY = "ratelimit:{}" # user_id -> {tokens, ts}
+RATE_LIMIT_TASKS_PER_SEC = float(os.getenv("RATE_LIMIT_TASKS_PER_SEC", "0"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "5000")) # bucket size; a larger request needs a full bucket
+
+# Refill the bucket for the time elapsed (Redis clock), then take ARGV[3] tokens if they are there.
+# KEYS: bucket hash. ARGV: rate (tokens/s), burst, cost. Returns "0", or the seconds until cost is available
+TOKEN_BUCKET_SCRIPT = """
+local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+token_bucket = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+queue_depth = {"queued": 0, "pending": 0, "read_at": 0.0} # last reading, shared by this process's requests
+queue_depth_lock = asyncio.Lock()
 
 # Pydantic Models
 class UserCreate(BaseModel):
@@ -52,7 +192,23 @@ class TaskCreate(BaseModel):
     max_execution_time: int = 30 # Default 30s
     task_type: str = "text_processing"
     simulated_duration: int = 5 # Default 5s simulated "work"
-    replicas: int = 1 # Number of tasks to create
+    replicas: int = Field(1, ge=1) # Number of tasks to create
+    priority: Optional[Literal["high", "normal", "low"]] = None # Defaults by task_type, else "normal"
+    run_at: Optional[datetime.datetime] = None # Dispatch at this time instead of now (UTC unless an offset is given)
+    cron: Optional[str] = None # Recurring: 5-field cron expression in UTC; every firing creates `replicas` tasks
+
+    def lane(self):
+        return self.priority or TASK_TYPE_LANES.get(self.task_type, "normal")
+
+class TaskBatchCreate(BaseModel):
+    tasks: list[TaskCreate] # Heterogeneous specs, each with its own replicas
+
+class DagNode(TaskCreate):
+    key: str # Client-chosen name, referenced by other nodes' parents
+    parents: list[str] = [] # Keys of the nodes that must complete before this one runs
+
+class DagCreate(BaseModel):
+    nodes: list[DagNode]
 
 class TaskResponse(BaseModel):
     id: int
@@ -65,14 +221,37 @@ class TaskResponse(BaseModel):
     owner_id: Optional[int] = None
     task_type: str
     simulated_duration: int
+    priority: str = "normal"
+    input_ref: Optional[str] = None # Set when input_data is only a preview; full input via /tasks/{id}/input
+    result_ref: Optional[str] = None # Set when result is only a preview; full result via /tasks/{id}/result
+    run_at: Optional[datetime.datetime] = None # Due time of a Scheduled task
+    schedule_id: Optional[int] = None # Recurring schedule that created the task
+    pending_parents: int = 0 # DAG parents that have not completed yet (status Waiting while > 0)
 
     class Config:
         from_attributes = True
 
-class UserQuotaResponse(BaseModel):
-    quota: int
-    used: int
-    available: int
+class ScheduleResponse(BaseModel):
+    id: int
+    cron: str
+    input_data: str
+    task_type: str
+    priority: str
+    replicas: int
+    max_execution_time: int
+    simulated_duration: int
+    next_run_at: datetime.datetime
+    is_active: bool
+    created_at: datetime.datetime
+
+    class Config:
+        from_attributes = True
+
+class TaskChangesResponse(BaseModel):
+    tasks: list[TaskResponse]
+    cursor: Optional[str] = None # Pass back as ?since= on the next poll
+    has_more: bool = False # More changes than `limit`; re-sync with a snapshot
+    status_counts: Optional[dict[str, int]] = None # Only sent when something changed
 
 class UserQuotaResponse(BaseModel):
     quota: int
@@ -80,53 +259,94 @@ class UserQuotaResponse(BaseModel):
     available: int
 
 # Auth Dependency
-def verify_token(authorization: str = Header(None)):
+def decode_token(token: str):
+    payload = token_cache.get(token)
+    if payload is not None:
+        if payload.get("exp", 0) > time.time():
+            token_cache.move_to_end(token)
+            return payload
+        token_cache.pop(token, None)
+
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except Exception as e:
+        raise HTTPException(status_code=401, detail="Invalid Token")
+
+    # Only tokens with an expiry are cached, so a cached entry can never outlive its token
+    if "exp" in payload:
+        token_cache[token] = payload
+        if len(token_cache) > TOKEN_CACHE_SIZE:
+            token_cache.popitem(last=False)
+    return payload
+
+async def verify_token(authorization: str = Header(None)):
     if not authorization:
         # For simplicity in this demo, if no token, we might allow or fail.
         # But requirement says "JWT-protected API".
         # Let's allow "Bearer <token>"
         raise HTTPException(status_code=401, detail="Missing Token")
     
-    try:
-        scheme, _, param = authorization.partition(" ")
-        if scheme.lower() != "bearer":
-             raise HTTPException(status_code=401, detail="Invalid token scheme")
-        payload = jwt.decode(param, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except Exception as e:
-        raise HTTPException(status_code=401, detail="Invalid Token")
+    scheme, _, param = authorization.partition(" ")
+    if scheme.lower() != "bearer":
+         raise HTTPException(status_code=401, detail="Invalid token scheme")
+    return decode_token(param)
 
 # --- Endpoints ---
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    # Queue gauges are read from Redis at scrape time
+    pipe = redis_client.pipeline(transaction=False)
+    for stream in LANE_STREAMS.values():
+        pipe.xlen(stream)
+    pipe.xlen(DLQ_KEY)
+    pipe.hgetall(CACHE_STATS_KEY)
+    pipe.zcard(CACHE_LRU_KEY)
+    *lengths, cache_stats, cache_entries = await pipe.execute()
+    for stream, length in zip([*LANE_STREAMS.values(), DLQ_KEY], lengths):
+        metrics.STREAM_LENGTH.labels(stream).set(length)
+    for stream in LANE_STREAMS.values():
+        try:
+            groups = await redis_client.xinfo_groups(stream)
+        except aioredis.ResponseError:
+            continue # no stream yet
+        for group in groups:
+            if group["name"] == GROUP_NAME:
+                metrics.STREAM_LAG.labels(stream).set(group.get("lag") or 0)
+                metrics.STREAM_PENDING.labels(stream).set(group["pending"])
+                metrics.STREAM_CONSUMERS.labels(stream).set(group["consumers"])
+    for name, value in cache_stats.items():
+        metrics.RESULT_CACHE.labels(name).set(int(value))
+    metrics.RESULT_CACHE_ENTRIES.set(cache_entries)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "ok", "service": "api"}
 
 @app.post("/signup")
-def signup(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
+async def signup(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    db_user = await db.scalar(select(models.User).where(models.User.username == user.username))
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
     
-    hashed_pwd = get_password_hash(user.password)
+    hashed_pwd = await hash_password_async(user.password)
     new_user = models.User(username=user.username, hashed_password=hashed_pwd)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
     return {"message": "User created successfully"}
 
 @app.get("/users/me/quota", response_model=UserQuotaResponse)
-def get_user_quota(db: Session = Depends(get_db), user_payload: dict = Depends(verify_token)):
+async def get_user_quota(db: AsyncSession = Depends(get_db), user_payload: dict = Depends(verify_token)):
     user_id = user_payload.get("user_id")
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    db_user = await db.get(models.User, user_id)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    total_tasks = db.query(models.Task).filter(models.Task.owner_id == user_id).count()
     return {
         "quota": db_user.task_quota,
-        "used": total_tasks,
-        "available": max(0, db_user.task_quota - total_tasks)
+        "used": db_user.tasks_used,
+        "available": max(0, db_user.task_quota - db_user.tasks_used)
     }
 
 class ProfileUpdate(BaseModel):
@@ -134,30 +354,29 @@ class ProfileUpdate(BaseModel):
     password: Optional[str] = None
 
 @app.put("/users/me")
-def update_profile(update_data: ProfileUpdate, db: Session = Depends(get_db), user_payload: dict = Depends(verify_token)):
+async def update_profile(update_data: ProfileUpdate, db: AsyncSession = Depends(get_db), user_payload: dict = Depends(verify_token)):
     user_id = user_payload.get("user_id")
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    db_user = await db.get(models.User, user_id)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     
     if update_data.username:
         # Check if username taken
-        existing = db.query(models.User).filter(models.User.username == update_data.username, models.User.id != user_id).first()
+        existing = await db.scalar(select(models.User).where(models.User.username == update_data.username, models.User.id != user_id))
         if existing:
             raise HTTPException(status_code=400, detail="Username already taken")
         db_user.username = update_data.username
     
     if update_data.password:
-        db_user.hashed_password = get_password_hash(update_data.password)
+        db_user.hashed_password = await hash_password_async(update_data.password)
     
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
     return {"message": "Profile updated successfully", "username": db_user.username}
 
 @app.post("/login")
-def login(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
-    if not db_user or not verify_password(user.password, db_user.hashed_password):
+async def login(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    db_user = await db.scalar(select(models.User).where(models.User.username == user.username))
+    if not db_user or not await verify_password_async(user.password, db_user.hashed_password):
         raise HTTPException(status_code=401, detail="Incorrect username or password")
     
     expiration = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
@@ -169,95 +388,563 @@ def login(user: UserCreate, db: Session = Depends(get_db)):
     }, SECRET_KEY, algorithm=ALGORITHM)
     return {"access_token": token, "token_type": "bearer", "is_admin": db_user.is_admin}
 
+async def reserve_quota(db: AsyncSession, user_id: int, requested: int):
+    """Atomically check-and-reserve quota; the row lock serialises concurrent bursts from one user."""
+    reserved = (await db.execute(
+        update(models.User)
+        .where(models.User.id == user_id, models.User.tasks_used + requested <= models.User.task_quota)
+        .values(tasks_used=models.User.tasks_used + requested)
+        .returning(models.User.tasks_used)
+    )).first()
+    if reserved is None:
+        await db.rollback()
+        db_user = await db.get(models.User, user_id)
+        if not db_user:
+            raise HTTPException(status_code=404, detail="User not found")
+        raise HTTPException(status_code=400, detail=f"Quota exceeded. Available: {max(0, db_user.task_quota - db_user.tasks_used)}")
+
+async def read_queue_depth() -> dict:
+    """Tasks waiting for a worker and entries in flight across all lanes, re-read at most every ADMISSION_REFRESH."""
+    async with queue_depth_lock:
+        if time.monotonic() - queue_depth["read_at"] < ADMISSION_REFRESH:
+            return queue_depth
+        pipe = redis_client.pipeline(transaction=False)
+        for stream in LANE_STREAMS.values():
+            pipe.xinfo_groups(stream)
+        for lane in LANE_STREAMS:
+            pipe.smembers(FAIR_OWNERS_KEY.format(lane))
+        results = await pipe.execute(raise_on_error=False)
+        groups, owners = results[:len(LANE_STREAMS)], results[len(LANE_STREAMS):]
+        queued = pending = 0
+        for stream_groups in groups:
+            if isinstance(stream_groups, Exception):
+                continue # no stream yet
+            for group in stream_groups:
+                if group["name"] == GROUP_NAME:
+                    queued += group.get("lag") or 0 # reported by Redis 7+
+                    pending += group["pending"]
+        # With fair share the backlog sits in the per-owner queues, not in the streams
+        fair_queues = [FAIR_QUEUE_KEY.format(lane, owner) for lane, lane_owners in zip(LANE_STREAMS, owners) for owner in lane_owners]
+        if fair_queues:
+            pipe = redis_client.pipeline(transaction=False)
+            for key in fair_queues:
+                pipe.llen(key)
+            queued += sum(await pipe.execute())
+        queue_depth.update(queued=queued, pending=pending, read_at=time.monotonic())
+        return queue_depth
+
+async def admit(lanes: list[str]):
+    """Admission control for a request queueing one task per entry in `lanes` now; raises 429 to shed it.
+
+    High-lane work is never shed and low-lane work is shed first.
+    """
+    if lanes and (ADMISSION_MAX_QUEUED or ADMISSION_MAX_PENDING):
+        depth = await read_queue_depth()
+        for lane in sorted(set(lanes) - {"high"}):
+            share = ADMISSION_LOW_SHARE if lane == "low" else 1.0
+            if (ADMISSION_MAX_QUEUED and depth["queued"] >= ADMISSION_MAX_QUEUED * share) or \
+               (ADMISSION_MAX_PENDING and depth["pending"] >= ADMISSION_MAX_PENDING * share):
+                metrics.DISPATCH_REJECTED.labels("overload").inc()
+                raise HTTPException(
+                    status_code=429,
+                    detail=f"Workers are overloaded ({depth['queued']} tasks queued, {depth['pending']} in flight). {lane.capitalize()}-priority dispatch is paused",
+                    headers={"Retry-After": str(ADMISSION_RETRY_AFTER)},
+                )
+
+async def take_rate_tokens(db: AsyncSession, user_id: int, count: int):
+    """Charge `count` tasks to the user's token bucket, or roll back the caller's transaction and raise 429.
+
+    Called once quota is reserved, so requests refused for quota or overload never spend tokens.
+    """
+    if RATE_LIMIT_TASKS_PER_SEC > 0 and count:
+        wait = float(await token_bucket(
+            keys=[RATE_LIMIT_KEY.format(user_id)],
+            args=[RATE_LIMIT_TASKS_PER_SEC, RATE_LIMIT_BURST, min(count, RATE_LIMIT_BURST)],
+        ))
+        if wait > 0:
+            await db.rollback()
+            metrics.DISPATCH_REJECTED.labels("rate_limit").inc()
+            raise HTTPException(
+                status_code=429,
+                detail=f"Rate limit exceeded ({RATE_LIMIT_TASKS_PER_SEC:g} tasks/s, burst {RATE_LIMIT_BURST})",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+
+def stream_fields(task: models.Task) -> dict:
+    """Stream entry for a task: its id, plus its execution spec when it is small enough to embed."""
+    fields = {"task_id": str(task.id)}
+    if EMBED_TASK_SPEC:
+        # Positional and separator-free to keep entries small; the order is mirrored in worker.parse_spec
+        spec = [task.input_data, task.max_execution_time, task.task_type, task.simulated_duration, task.owner_id]
+        if task.input_ref:
+            spec.append(task.input_ref) # input_data is only a preview; the worker loads the blob
+        spec = json.dumps(spec, separators=(",", ":"))
+        if len(spec.encode()) <= MAX_EMBEDDED_SPEC_BYTES:
+            fields["spec"] = spec
+    return fields
+
+def first_run_at(spec: TaskCreate, now: datetime.datetime):
+    """When the spec's tasks are due, or None to dispatch them right away."""
+    run_at = spec.run_at
+    if run_at is not None and run_at.tzinfo is None:
+        run_at = run_at.replace(tzinfo=datetime.timezone.utc)
+    if spec.cron:
+        if not croniter.is_valid(spec.cron) or len(spec.cron.split()) != 5:
+            raise HTTPException(status_code=400, detail=f"Invalid cron expression: {spec.cron!r}")
+        # First firing after run_at (or now); later firings are created by worker/scheduler.py
+        return croniter(spec.cron, max(now, run_at or now)).get_next(datetime.datetime)
+    return run_at if run_at is not None and run_at > now else None
+
+async def dispatch_tasks(db: AsyncSession, user_id: int, specs: list[TaskCreate]):
+    """Reserve quota, insert every replica of every spec in one transaction and push them to Redis in one pipeline.
+
+    Tasks due later are inserted as Scheduled and only added to the schedule zset; specs with a cron
+    expression also create their recurring Schedule row.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    rows, row_schedules, schedules = [], [], []
+    for spec in specs:
+        due = first_run_at(spec, now)
+        # Large inputs go to the blob store once per spec; every replica shares the reference
+        input_data, input_ref = spec.input_data, None
+        if len(spec.input_data.encode()) > blobstore.BLOB_THRESHOLD:
+            input_data, input_ref = await asyncio.to_thread(blobstore.offload, spec.input_data)
+        schedule = None
+        if spec.cron:
+            schedule = models.Schedule(
+                owner_id=user_id, cron=spec.cron, input_data=input_data, input_ref=input_ref,
+                max_execution_time=spec.max_execution_time, task_type=spec.task_type,
+                simulated_duration=spec.simulated_duration, priority=spec.lane(), replicas=spec.replicas,
+                next_run_at=due,
+            )
+            schedules.append(schedule)
+        for _ in range(spec.replicas):
+            rows.append({
+                "input_data": input_data,
+                "input_ref": input_ref,
+                "status": "Scheduled" if due else "Pending",
+                "owner_id": user_id,
+                "max_execution_time": spec.max_execution_time,
+                "task_type": spec.task_type,
+                "simulated_duration": spec.simulated_duration,
+                "priority": spec.lane(),
+                "run_at": due,
+                "schedule_id": None,
+            })
+            row_schedules.append(schedule)
+    if not rows:
+        return []
+
+    # Tasks due later are already deferred and do not add to the current backlog
+    await admit([row["priority"] for row in rows if row["status"] == "Pending"])
+
+    # 1. Save to DB: quota reservation plus a single multi-row INSERT ... RETURNING, one commit
+    await reserve_quota(db, user_id, len(rows))
+    await take_rate_tokens(db, user_id, len(rows))
+    if schedules:
+        db.add_all(schedules)
+        await db.flush() # assigns the ids the first occurrence points at
+        for row, schedule in zip(rows, row_schedules):
+            row["schedule_id"] = schedule.id if schedule else None
+    created_tasks = (await db.scalars(insert(models.Task).returning(models.Task), rows)).all()
+    await db.commit()
+
+    # 2. Push to Redis: one round trip for the whole batch
+    await push_tasks(created_tasks, user_id)
+    return created_tasks
+
+def queue_task(pipe, db_task: models.Task):
+    """Queue a Pending task on its lane, or on its owner's fair-share queue when the dispatcher runs."""
+    if FAIR_SHARE:
+        pipe.rpush(FAIR_QUEUE_KEY.format(db_task.priority, db_task.owner_id), json.dumps(stream_fields(db_task)))
+        pipe.sadd(FAIR_OWNERS_KEY.format(db_task.priority), db_task.owner_id)
+    else:
+        pipe.xadd(LANE_STREAMS[db_task.priority], stream_fields(db_task))
+    metrics.TASKS_DISPATCHED.labels(db_task.priority).inc()
+
+async def push_tasks(tasks: list[models.Task], user_id: int):
+    """Hand freshly committed tasks to Redis in one pipeline, according to their status."""
+    pipe = redis_client.pipeline(transaction=False)
+    for db_task in tasks:
+        if db_task.status == "Scheduled":
+            pipe.zadd(SCHEDULE_KEY, {db_task.id: db_task.run_at.timestamp()})
+        elif db_task.status == "Pending":
+            queue_task(pipe, db_task)
+        # Waiting tasks are queued later by the worker that completes their last parent
+        pipe.publish(TASK_EVENTS_CHANNEL, task_event(db_task.id, user_id, db_task.status))
+    await pipe.execute()
+
+def dag_parents(nodes: list[DagNode]) -> list[list[int]]:
+    """Validate a DAG submission and return each node's parents as node indexes."""
+    index = {}
+    for i, node in enumerate(nodes):
+        if node.key in index:
+            raise HTTPException(status_code=400, detail=f"Duplicate DAG node key: {node.key!r}")
+        if node.replicas != 1 or node.run_at or node.cron:
+            raise HTTPException(status_code=400, detail="DAG nodes are single tasks: replicas, run_at and cron are not supported")
+        index[node.key] = i
+    parents = []
+    for node in nodes:
+        missing = [key for key in node.parents if key not in index]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Node {node.key!r} has unknown parents: {missing}")
+        parents.append(sorted({index[key] for key in node.parents}))
+
+    # Kahn's algorithm: nodes on a cycle never reach in-degree 0
+    indegree = [len(p) for p in parents]
+    children = [[] for _ in nodes]
+    for child, node_parents in enumerate(parents):
+        for parent in node_parents:
+            children[parent].append(child)
+    ready = [i for i, degree in enumerate(indegree) if degree == 0]
+    visited = 0
+    while ready:
+        visited += 1
+        for child in children[ready.pop()]:
+            indegree[child] -= 1
+            if indegree[child] == 0:
+                ready.append(child)
+    if visited != len(nodes):
+        raise HTTPException(status_code=400, detail="DAG contains a cycle")
+    return parents
+
+async def dispatch_dag(db: AsyncSession, user_id: int, dag: DagCreate):
+    """Insert a validated DAG (nodes, then the edges between their new ids) in one transaction and queue its roots."""
+    parents = dag_parents(dag.nodes)
+    if not dag.nodes:
+        return []
+
+    rows = []
+    for node, node_parents in zip(dag.nodes, parents):
+        input_data, input_ref = node.input_data, None
+        if len(node.input_data.encode()) > blobstore.BLOB_THRESHOLD:
+            input_data, input_ref = await asyncio.to_thread(blobstore.offload, node.input_data)
+        rows.append({
+            "input_data": input_data,
+            "input_ref": input_ref,
+            "status": "Waiting" if node_parents else "Pending",
+            "owner_id": user_id,
+            "max_execution_time": node.max_execution_time,
+            "task_type": node.task_type,
+            "simulated_duration": node.simulated_duration,
+            "priority": node.lane(),
+            "pending_parents": len(node_parents),
+        })
+
+    # Only the roots are queued now; the other nodes wait for their parents
+    await admit([row["priority"] for row in rows if row["status"] == "Pending"])
+
+    # Nodes, then edges between their new ids, in one transaction
+    await reserve_quota(db, user_id, len(rows))
+    await take_rate_tokens(db, user_id, len(rows))
+    created_tasks = (await db.scalars(insert(models.Task).returning(models.Task, sort_by_parameter_order=True), rows)).all()
+    edges = [
+        {"parent_id": created_tasks[parent].id, "child_id": created_tasks[child].id}
+        for child, node_parents in enumerate(parents) for parent in node_parents
+    ]
+    if edges:
+        await db.execute(insert(models.TaskDependency), edges)
+    await db.commit()
+
+    await push_tasks(created_tasks, user_id)
+    return created_tasks
+
+async def cancel_downstream(db: AsyncSession, task_ids: list[int]) -> list[int]:
+    """Cancel every Waiting descendant of task_ids, whose parents can no longer complete. Caller commits."""
+    if not task_ids:
+        return []
+    return (await db.execute(text(
+        "WITH RECURSIVE downstream(id) AS ("
+        " SELECT child_id FROM task_dependencies WHERE parent_id = ANY(:ids)"
+        " UNION SELECT d.child_id FROM task_dependencies d JOIN downstream ON d.parent_id = downstream.id)"
+        " UPDATE tasks SET status = 'Cancelled', is_cancelled = true, updated_at = NOW()"
+        " FROM downstream WHERE tasks.id = downstream.id AND tasks.status = 'Waiting' RETURNING tasks.id"
+    ), {"ids": list(task_ids)})).scalars().all()
+
+async def reconcile_quota_counters(db: AsyncSession):
+    """Repair drift between users.tasks_used and the actual number of task rows.
+
+    An unlocked pass only finds candidates. Each one is then re-counted under its user row lock, which
+    reserve_quota holds until its tasks commit, so an in-flight reservation is never undone.
+    """
+    actual = (
+        select(func.count(models.Task.id))
+        .where(models.Task.owner_id == models.User.id)
+        .scalar_subquery()
+    )
+    drifted = (await db.scalars(select(models.User.id).where(models.User.tasks_used != actual))).all()
+    await db.commit()
+    repaired = 0
+    for user_id in drifted:
+        # One short transaction per user: lock, count, fix
+        await db.execute(select(models.User.id).where(models.User.id == user_id).with_for_update())
+        count = await db.scalar(select(func.count(models.Task.id)).where(models.Task.owner_id == user_id))
+        repaired += (await db.execute(
+            update(models.User)
+            .where(models.User.id == user_id, models.User.tasks_used != count)
+            .values(tasks_used=count)
+        )).rowcount
+        await db.commit()
+    return repaired
+
+async def quota_reconciler():
+    # Runs once at startup too, which backfills counters on databases that predate tasks_used
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                repaired = await reconcile_quota_counters(db)
+            if repaired:
+                print(f"Quota reconciler repaired {repaired} user counters")
+        except Exception as e:
+            print(f"Quota reconciler error: {e}")
+        await asyncio.sleep(QUOTA_RECONCILE_INTERVAL)
+
+@app.on_event("startup")
+async def start_quota_reconciler():
+    if QUOTA_RECONCILE_INTERVAL > 0:
+        asyncio.create_task(quota_reconciler())
+
+async def idempotent(user_id: int, key: Optional[str], route: str, request: BaseModel, create):
+    """Run create() once per (user, Idempotency-Key) and replay its response to retries.
+
+    A retry racing the original gets 409 and should back off; reusing a key for a different request
+    is a client bug (422). A request that fails releases its key so it can be retried as is.
+    """
+    if key is None:
+        return await create()
+    if not key or len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{MAX_IDEMPOTENCY_KEY_LENGTH} characters")
+    redis_key = IDEMPOTENCY_KEY.format(user_id, key)
+    fingerprint = hashlib.sha256(f"{route}\0{request.model_dump_json()}".encode()).hexdigest()
+
+    # One SET NX decides who runs the request; everyone else reads what it left behind
+    if not await redis_client.set(redis_key, json.dumps({"fingerprint": fingerprint}), nx=True, ex=IDEMPOTENCY_LOCK_TTL):
+        stored = await redis_client.get(redis_key)
+        stored = json.loads(stored) if stored else {}
+        if stored.get("fingerprint", fingerprint) != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        if "response" not in stored:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        return JSONResponse(stored["response"], headers={"Idempotent-Replayed": "true"})
+
+    try:
+        tasks = await create()
+    except Exception:
+        await redis_client.delete(redis_key)
+        raise
+    response = [TaskResponse.model_validate(task).model_dump(mode="json") for task in tasks]
+    await redis_client.set(redis_key, json.dumps({"fingerprint": fingerprint, "response": response}), ex=IDEMPOTENCY_TTL)
+    return response
+
 @app.post("/tasks", response_model=list[TaskResponse])
-def create_task(task: TaskCreate, db: Session = Depends(get_db), user_payload: dict = Depends(verify_token)):
+async def create_task(task: TaskCreate, db: AsyncSession = Depends(get_db), user_payload: dict = Depends(verify_token),
+                      idempotency_key: Optional[str] = Header(None)):
     user_id = user_payload.get("user_id")
     
-    # Quota Check
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
-    current_count = db.query(models.Task).filter(models.Task.owner_id == user_id).count()
-    if current_count + task.replicas > db_user.task_quota:
-        raise HTTPException(status_code=400, detail=f"Quota exceeded. Available: {db_user.task_quota - current_count}")
-
     print(f"DEBUG: Creating {task.replicas} tasks - Input: {task.input_data[:20]}, Timeout: {task.max_execution_time}, Workload: {task.simulated_duration}")
     
-    created_tasks = []
-    for i in range(task.replicas):
-        # 1. Save to DB
-        db_task = models.Task(
-            input_data=task.input_data, 
-            status="Pending",
-            owner_id=user_id,
-            max_execution_time=task.max_execution_time,
-            task_type=task.task_type,
-            simulated_duration=task.simulated_duration
-        )
-        db.add(db_task)
-        db.commit()
-        db.refresh(db_task)
-
-        # 2. Push to Redis (Stream or List)
-        redis_client.xadd("task_stream", {"task_id": str(db_task.id)})
-        created_tasks.append(db_task)
-    
-    return created_tasks
+    return await idempotent(user_id, idempotency_key, "tasks", task, lambda: dispatch_tasks(db, user_id, [task]))
+
+@app.post("/tasks/bulk", response_model=list[TaskResponse])
+async def create_tasks_bulk(batch: TaskBatchCreate, db: AsyncSession = Depends(get_db), user_payload: dict = Depends(verify_token),
+                            idempotency_key: Optional[str] = Header(None)):
+    user_id = user_payload.get("user_id")
+    total = sum(spec.replicas for spec in batch.tasks)
+    if total > MAX_BULK_TASKS:
+        raise HTTPException(status_code=400, detail=f"Batch too large. Max {MAX_BULK_TASKS} tasks per call")
+
+    return await idempotent(user_id, idempotency_key, "tasks/bulk", batch, lambda: dispatch_tasks(db, user_id, batch.tasks))
+
+@app.post("/tasks/dag", response_model=list[TaskResponse])
+async def create_task_dag(dag: DagCreate, db: AsyncSession = Depends(get_db), user_payload: dict = Depends(verify_token),
+                          idempotency_key: Optional[str] = Header(None)):
+    """Submit a dependency graph in one call; tasks come back in node order.
+
+    Roots are queued right away. Every other node starts Waiting and is queued by the worker that
+    completes its last parent; a failed or cancelled parent fails or cancels everything downstream.
+    """
+    user_id = user_payload.get("user_id")
+    if len(dag.nodes) > MAX_BULK_TASKS:
+        raise HTTPException(status_code=400, detail=f"DAG too large. Max {MAX_BULK_TASKS} nodes per call")
+
+    return await idempotent(user_id, idempotency_key, "tasks/dag", dag, lambda: dispatch_dag(db, user_id, dag))
 
 @app.post("/tasks/kill-all")
-def kill_all_tasks(db: Session = Depends(get_db), user_payload: dict = Depends(verify_token)):
+async def kill_all_tasks(db: AsyncSession = Depends(get_db), user_payload: dict = Depends(verify_token)):
     user_id = user_payload.get("user_id")
-    # Mark all active/pending tasks as Cancelled
-    tasks = db.query(models.Task).filter(
+    # Mark all active/pending tasks as Cancelled and stop the user's recurring schedules
+    tasks = (await db.scalars(select(models.Task).where(
         models.Task.owner_id == user_id,
-        models.Task.status.in_(["Pending", "Processing"])
-    ).all()
+        models.Task.status.in_(["Waiting", "Scheduled", "Pending", "Processing"])
+    ))).all()
+    await db.execute(update(models.Schedule).where(models.Schedule.owner_id == user_id).values(is_active=False))
     
+    cancelled_ids = []
     for task in tasks:
         task.status = "Cancelled"
         task.is_cancelled = True
+        cancelled_ids.append(task.id)
     
-    db.commit()
+    await db.commit()
+    await publish_cancellations(cancelled_ids)
+    pipe = redis_client.pipeline(transaction=False)
+    if cancelled_ids:
+        pipe.zrem(SCHEDULE_KEY, *cancelled_ids)
+    for task_id in cancelled_ids:
+        pipe.publish(TASK_EVENTS_CHANNEL, task_event(task_id, user_id, "Cancelled"))
+    await pipe.execute()
     return {"message": f"Terminated {len(tasks)} active tasks"}
 
 @app.post("/admin/reset-system")
-def reset_system(db: Session = Depends(get_db), user_payload: dict = Depends(verify_token)):
+async def reset_system(db: AsyncSession = Depends(get_db), user_payload: dict = Depends(verify_token)):
     if not user_payload.get("is_admin"):
         raise HTTPException(status_code=403, detail="Forbidden: Admin access required")
     
     # Thorough Reset: Clear all tasks and reset ID sequence
-    db.execute("TRUNCATE TABLE tasks RESTART IDENTITY CASCADE;")
-    db.commit()
+    await db.execute(text("TRUNCATE TABLE tasks, schedules RESTART IDENTITY CASCADE;"))
+    await db.execute(update(models.User).values(tasks_used=0))
+    await db.commit()
     # Clear Redis
-    redis_client.delete("task_stream")
+    scoped_keys = [
+        key for pattern in ("fair:*", "result_cache:*", "idempotency:*", "ratelimit:*", "status_counts:*")
+        async for key in redis_client.scan_iter(match=pattern) if key != FAIR_LIMITS_KEY
+    ]
+    await redis_client.delete(*LANE_STREAMS.values(), DLQ_KEY, SCHEDULE_KEY, *scoped_keys)
+    await asyncio.to_thread(blobstore.clear)
     return {"message": "System purged successfully. All records cleared and IDs reset."}
 
+@app.get("/admin/result-cache")
+async def result_cache_stats(user_payload: dict = Depends(verify_token)):
+    if not user_payload.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Forbidden: Admin access required")
+    
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hgetall(CACHE_STATS_KEY)
+    pipe.zcard(CACHE_LRU_KEY)
+    raw, entries = await pipe.execute()
+    stats = {name: int(raw.get(name, 0)) for name in ("hits", "misses", "coalesced", "fills", "evictions")}
+    # Coalesced tasks missed the cache but still skipped execution
+    lookups = stats["hits"] + stats["misses"]
+    return {
+        **stats,
+        "entries": entries,
+        "hit_ratio": round(stats["hits"] / lookups, 4) if lookups else None,
+        "executions_saved": stats["hits"] + stats["coalesced"],
+    }
+
+@app.get("/admin/dlq")
+async def inspect_dlq(start: str = "-", count: int = 100, user_payload: dict = Depends(verify_token)):
+    if not user_payload.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Forbidden: Admin access required")
+    
+    count = max(1, min(count, MAX_DLQ_BATCH))
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.xlen(DLQ_KEY)
+    pipe.xrange(DLQ_KEY, min=start, max="+", count=count)
+    total, entries = await pipe.execute()
+    return {
+        "total": total,
+        "entries": [{"id": entry_id, **fields} for entry_id, fields in entries],
+    }
+
+@app.post("/admin/dlq/replay")
+async def replay_dlq(count: int = 100, db: AsyncSession = Depends(get_db), user_payload: dict = Depends(verify_token)):
+    if not user_payload.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Forbidden: Admin access required")
+    
+    count = max(1, min(count, MAX_DLQ_BATCH))
+    entries = await redis_client.xrange(DLQ_KEY, min="-", max="+", count=count)
+    if not entries:
+        return {"message": "DLQ is empty", "replayed": 0}
+
+    # Re-arm the dead-lettered tasks (cancelled ones stay cancelled), then requeue them in one pipeline
+    task_ids = [int(fields["task_id"]) for _, fields in entries if fields.get("task_id")]
+    rearmed = (await db.scalars(
+        update(models.Task)
+        .where(models.Task.id.in_(task_ids), models.Task.status == "Failed", models.Task.is_cancelled == False)
+        .values(status="Pending", result=None)
+        .returning(models.Task)
+    )).all()
+    await db.commit()
+
+    # Same path as a fresh dispatch, so fair share still applies to replayed tasks
+    pipe = redis_client.pipeline(transaction=True)
+    for db_task in rearmed:
+        queue_task(pipe, db_task)
+    pipe.xdel(DLQ_KEY, *[entry_id for entry_id, _ in entries])
+    await pipe.execute()
+    return {"message": f"Replayed {len(rearmed)} tasks, removed {len(entries)} DLQ entries", "replayed": len(rearmed)}
+
+@app.post("/admin/reconcile-quotas")
+async def reconcile_quotas(db: AsyncSession = Depends(get_db), user_payload: dict = Depends(verify_token)):
+    if not user_payload.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Forbidden: Admin access required")
+    
+    repaired = await reconcile_quota_counters(db)
+    return {"message": f"Reconciled quota counters. {repaired} users repaired."}
+
 @app.get("/admin/users")
-def get_all_users(db: Session = Depends(get_db), user_payload: dict = Depends(verify_token)):
+async def get_all_users(db: AsyncSession = Depends(get_db), user_payload: dict = Depends(verify_token)):
     if not user_payload.get("is_admin"):
         raise HTTPException(status_code=403, detail="Forbidden: Admin access required")
     
-    users = db.query(models.User).all()
+    users = (await db.scalars(select(models.User))).all()
     result = []
     for u in users:
-        task_count = db.query(models.Task).filter(models.Task.owner_id == u.id).count()
         result.append({
             "id": u.id,
             "username": u.username,
             "is_admin": u.is_admin,
             "task_quota": u.task_quota,
-            "tasks_dispatched": task_count
+            "tasks_dispatched": u.tasks_used
         })
     return result
 
 @app.delete("/tasks")
-def delete_my_tasks(db: Session = Depends(get_db), user_payload: dict = Depends(verify_token)):
+async def delete_my_tasks(db: AsyncSession = Depends(get_db), user_payload: dict = Depends(verify_token)):
     user_id = user_payload.get("user_id")
-    deleted_count = db.query(models.Task).filter(models.Task.owner_id == user_id).delete()
-    db.commit()
+    # Zero the counter first: the row lock holds off concurrent dispatches until the delete commits
+    await db.execute(update(models.User).where(models.User.id == user_id).values(tasks_used=0))
+    deleted_count = (await db.execute(delete(models.Task).where(models.Task.owner_id == user_id))).rowcount
+    await db.commit()
     return {"message": f"Successfully deleted {deleted_count} tasks from your history."}
 
+@app.get("/schedules", response_model=list[ScheduleResponse])
+async def list_schedules(db: AsyncSession = Depends(get_db), user_payload: dict = Depends(verify_token)):
+    return (await db.scalars(
+        select(models.Schedule).where(models.Schedule.owner_id == user_payload.get("user_id")).order_by(models.Schedule.id.desc())
+    )).all()
+
+@app.delete("/schedules/{schedule_id}")
+async def delete_schedule(schedule_id: int, db: AsyncSession = Depends(get_db), user_payload: dict = Depends(verify_token)):
+    """Stop a recurring schedule and cancel its occurrences that have not been dispatched yet."""
+    user_id = user_payload.get("user_id")
+    schedule = await db.get(models.Schedule, schedule_id)
+    if not schedule:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    if schedule.owner_id != user_id:
+        raise HTTPException(status_code=403, detail="Not authorized to delete this schedule")
+
+    schedule.is_active = False
+    cancelled_ids = (await db.scalars(
+        update(models.Task)
+        .where(models.Task.schedule_id == schedule_id, models.Task.status == "Scheduled")
+        .values(status="Cancelled", is_cancelled=True)
+        .returning(models.Task.id)
+    )).all()
+    await db.commit()
+
+    pipe = redis_client.pipeline(transaction=False)
+    if cancelled_ids:
+        pipe.zrem(SCHEDULE_KEY, *cancelled_ids)
+    for task_id in cancelled_ids:
+        pipe.publish(TASK_EVENTS_CHANNEL, task_event(task_id, user_id, "Cancelled"))
+    await pipe.execute()
+    return {"message": f"Schedule stopped, {len(cancelled_ids)} upcoming tasks cancelled"}
+
 @app.post("/tasks/{task_id}/cancel")
-def cancel_task(task_id: int, db: Session = Depends(get_db), user_payload: dict = Depends(verify_token)):
-    task = db.query(models.Task).filter(models.Task.id == task_id).first()
+async def cancel_task(task_id: int, db: AsyncSession = Depends(get_db), user_payload: dict = Depends(verify_token)):
+    task = await db.get(models.Task, task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
@@ -268,19 +955,264 @@ def cancel_task(task_id: int, db: Session = Depends(get_db), user_payload: dict
     if task.status in ["Completed", "Failed", "Cancelled"]:
         return {"message": "Task already finished"}
 
+    was_scheduled = task.status == "Scheduled"
     task.is_cancelled = True
     task.status = "Cancelled"
-    db.commit()
+    downstream_ids = await cancel_downstream(db, [task_id])
+    await db.commit()
+    if was_scheduled:
+        # Only this occurrence: a recurring schedule keeps firing until DELETE /schedules/{id}
+        await redis_client.zrem(SCHEDULE_KEY, task_id)
+    await publish_cancellations([task_id])
+    pipe = redis_client.pipeline(transaction=False)
+    for cancelled_id in [task_id, *downstream_ids]:
+        pipe.publish(TASK_EVENTS_CHANNEL, task_event(cancelled_id, task.owner_id, "Cancelled"))
+    await pipe.execute()
     return {"message": "Task cancelled"}
 
 @app.get("/tasks", response_model=list[TaskResponse])
-def get_tasks(skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
-    tasks = db.query(models.Task).order_by(models.Task.id.desc()).offset(skip).limit(limit).all()
+async def get_tasks(
+    response: Response,
+    skip: int = 0,
+    limit: int = 20,
+    cursor: Optional[int] = None,
+    owner_id: Optional[int] = None,
+    status: Optional[str] = None,
+    task_type: Optional[str] = None,
+    created_after: Optional[datetime.datetime] = None,
+    created_before: Optional[datetime.datetime] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = select(models.Task)
+    if owner_id is not None:
+        query = query.where(models.Task.owner_id == owner_id)
+    if status:
+        query = query.where(models.Task.status == status)
+    if task_type:
+        query = query.where(models.Task.task_type == task_type)
+    if created_after:
+        query = query.where(models.Task.created_at >= created_after)
+    if created_before:
+        query = query.where(models.Task.created_at < created_before)
+
+    # Keyset pagination: pass the X-Next-Cursor of the previous page. `skip` is kept for old clients.
+    if cursor is not None:
+        query = query.where(models.Task.id < cursor)
+    elif skip:
+        query = query.offset(skip)
+
+    tasks = (await db.scalars(query.order_by(models.Task.id.desc()).limit(limit))).all()
+    if len(tasks) == limit:
+        response.headers["X-Next-Cursor"] = str(tasks[-1].id)
     return tasks
 
+async def task_status_counts(db: AsyncSession, owner_id: Optional[int]):
+    key = STATUS_COUNTS_KEY.format("all" if owner_id is None else owner_id)
+    cached = await redis_client.get(key)
+    if cached is not None:
+        return json.loads(cached)
+    query = select(models.Task.status, func.count(models.Task.id))
+    if owner_id is not None:
+        query = query.where(models.Task.owner_id == owner_id)
+    counts = dict((await db.execute(query.group_by(models.Task.status))).all())
+    await redis_client.set(key, json.dumps(counts), px=STATUS_COUNTS_TTL)
+    return counts
+
+@app.get("/tasks/changes", response_model=TaskChangesResponse)
+async def get_task_changes(since: Optional[str] = None, limit: int = 100, owner_id: Optional[int] = None, db: AsyncSession = Depends(get_db)):
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = select(models.Task)
+    if owner_id is not None:
+        query = query.where(models.Task.owner_id == owner_id)
+
+    # No cursor: snapshot of the newest tasks plus the cursor to poll from
+    if not since:
+        tasks = (await db.scalars(query.order_by(models.Task.id.desc()).limit(limit))).all()
+        cursor = await db.scalar(select(func.max(models.Task.updated_at)))
+        return {
+            "tasks": tasks,
+            "cursor": cursor.isoformat() if cursor else None,
+            "status_counts": await task_status_counts(db, owner_id),
+        }
+
+    # "<updated_at>" starts a poll; "<updated_at>,<id>,<poll cursor>" continues it after its last row
+    parts = since.split(",")
+
+    def parse_ts(value):
+        # A cursor without an offset is taken as UTC, like the updated_at values it is compared to
+        ts = datetime.datetime.fromisoformat(value)
+        return ts if ts.tzinfo else ts.replace(tzinfo=datetime.timezone.utc)
+
+    try:
+        since_ts = parse_ts(parts[-1])
+        if len(parts) == 3:
+            after = (parse_ts(parts[0]), int(parts[1]))
+        elif len(parts) == 1:
+            after = None
+        else:
+            raise ValueError(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if after is None:
+        # First page: rows are re-sent for CHANGES_OVERLAP before the cursor; clients merge by id
+        query = query.where(models.Task.updated_at > since_ts - CHANGES_OVERLAP)
+    else:
+        query = query.where(tuple_(models.Task.updated_at, models.Task.id) > tuple_(*after))
+    tasks = (await db.scalars(
+        query.order_by(models.Task.updated_at.asc(), models.Task.id.asc()).limit(limit + 1)
+    )).all()
+    has_more = len(tasks) > limit
+    tasks = tasks[:limit]
+    if has_more:
+        cursor = f"{tasks[-1].updated_at.isoformat()},{tasks[-1].id},{since_ts.isoformat()}"
+    else:
+        cursor = max([since_ts, *(t.updated_at for t in tasks)]).isoformat()
+    fresh = any(t.updated_at > since_ts for t in tasks)
+    return {
+        "tasks": tasks if fresh else [],
+        "cursor": cursor,
+        "has_more": has_more,
+        "status_counts": await task_status_counts(db, owner_id) if fresh else None,
+    }
+
+async def task_event_fanout():
+    """One subscription per API instance; events are routed to the owner's connected clients."""
+    while True:
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(TASK_EVENTS_CHANNEL)
+            async for message in pubsub.listen():
+                owner_id = json.loads(message["data"]).get("owner_id")
+                for queue in list(task_event_subscribers.get(owner_id, ())):
+                    try:
+                        queue.put_nowait(message["data"])
+                    except asyncio.QueueFull:
+                        pass
+        except Exception as e:
+            print(f"Task event fan-out error: {e}")
+            await asyncio.sleep(1)
+
+@app.on_event("startup")
+async def start_task_event_fanout():
+    asyncio.create_task(task_event_fanout())
+
+@app.get("/tasks/stream")
+async def stream_task_events(request: Request, token: Optional[str] = None, authorization: str = Header(None)):
+    # EventSource cannot set headers, so the token may also come as ?token=
+    payload = decode_token(token) if token else await verify_token(authorization)
+    owner_id = payload.get("user_id")
+
+    queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+    task_event_subscribers.setdefault(owner_id, set()).add(queue)
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    data = await asyncio.wait_for(queue.get(), timeout=STREAM_KEEPALIVE)
+                    yield f"event: task\ndata: {data}\n\n"
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            subscribers = task_event_subscribers.get(owner_id, set())
+            subscribers.discard(queue)
+            if not subscribers:
+                task_event_subscribers.pop(owner_id, None)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+BLOB_CHUNK_SIZE = 64 * 1024
+
+def parse_range(range_header: Optional[str], size: int):
+    """Inclusive (start, end) of a single "bytes=" range, or None to send everything."""
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None # Multiple ranges are answered with the full body, which RFC 9110 allows
+    first, _, last = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start, end = int(first), int(last) if last else size - 1
+        else:
+            start, end = size - int(last), size - 1 # suffix range: the last N bytes
+    except ValueError:
+        return None
+    start, end = max(0, start), min(end, size - 1)
+    if start > end:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+def read_chunks(path: Optional[str], data: Optional[bytes], start: int, length: int):
+    # Sync generator: Starlette iterates it in its threadpool, so file reads never block the event loop
+    if path is None:
+        for offset in range(start, start + length, BLOB_CHUNK_SIZE):
+            yield data[offset:min(offset + BLOB_CHUNK_SIZE, start + length)]
+        return
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(BLOB_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+async def download_payload(request: Request, task_id: int, field: str, token: Optional[str], authorization: Optional[str], db: AsyncSession):
+    # Links and <a download> cannot set headers, so the token may also come as ?token=
+    payload = decode_token(token) if token else await verify_token(authorization)
+    task = await db.get(models.Task, task_id)
+    if not task or (task.owner_id != payload.get("user_id") and not payload.get("is_admin")):
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    value, ref = (task.input_data, task.input_ref) if field == "input" else (task.result, task.result_ref)
+    if value is None and ref is None:
+        raise HTTPException(status_code=404, detail=f"Task has no {field} yet")
+    if ref:
+        path, data = blobstore.blob_path(ref), None
+        try:
+            size = await asyncio.to_thread(os.path.getsize, path)
+        except FileNotFoundError:
+            raise HTTPException(status_code=410, detail=f"Stored {field} is no longer available")
+    else:
+        path, data = None, value.encode()
+        size = len(data)
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="task-{task_id}-{field}.txt"',
+    }
+    if ref:
+        headers["ETag"] = f'"{ref}"'
+    byte_range = parse_range(request.headers.get("range"), size) if size else None
+    start, end = byte_range or (0, size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return StreamingResponse(
+        read_chunks(path, data, start, end - start + 1),
+        status_code=206 if byte_range else 200,
+        media_type="text/plain; charset=utf-8",
+        headers=headers,
+    )
+
+@app.get("/tasks/{task_id}/result")
+async def download_result(request: Request, task_id: int, token: Optional[str] = None, authorization: str = Header(None), db: AsyncSession = Depends(get_db)):
+    """Full result, including ones offloaded to the blob store; supports Range requests."""
+    return await download_payload(request, task_id, "result", token, authorization, db)
+
+@app.get("/tasks/{task_id}/input")
+async def download_input(request: Request, task_id: int, token: Optional[str] = None, authorization: str = Header(None), db: AsyncSession = Depends(get_db)):
+    """Full input_data, including inputs offloaded to the blob store; supports Range requests."""
+    return await download_payload(request, task_id, "input", token, authorization, db)
+
 @app.get("/tasks/{task_id}", response_model=TaskResponse)
-def get_task(task_id: int, db: Session = Depends(get_db)):
-    task = db.query(models.Task).filter(models.Task.id == task_id).first()
+async def get_task(task_id: int, db: AsyncSession = Depends(get_db)):
+    task = await db.get(models.Task, task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     return task
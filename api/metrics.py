@@ -0,0 +1,44 @@
+# Prometheus metrics for the API, served at GET /metrics.
+import time
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event
+
+# Request latency per route template (e.g. /tasks/{task_id}), not per raw path
+REQUEST_SECONDS = Histogram(
+    "api_request_duration_seconds", "HTTP request latency until the response starts",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+DB_QUERY_SECONDS = Histogram(
+    "api_db_query_duration_seconds", "Database statement latency as seen by the API",
+    ["operation"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+TASKS_DISPATCHED = Counter("api_tasks_dispatched_total", "Tasks created and queued", ["lane"])
+DISPATCH_REJECTED = Counter("api_dispatch_rejected_total", "Dispatch requests refused with 429", ["reason"]) # overload, rate_limit
+
+# Refreshed from Redis on every scrape
+STREAM_LENGTH = Gauge("task_stream_length", "Entries in the stream (XLEN)", ["stream"])
+STREAM_LAG = Gauge("task_stream_group_lag", "Entries not yet delivered to the consumer group", ["stream"])
+STREAM_PENDING = Gauge("task_stream_group_pending", "Delivered but not yet acknowledged entries", ["stream"])
+STREAM_CONSUMERS = Gauge("task_stream_group_consumers", "Consumers registered in the group", ["stream"])
+RESULT_CACHE = Gauge("result_cache_events", "Cluster-wide result cache counters (worker/result_cache.py)", ["event"])
+RESULT_CACHE_ENTRIES = Gauge("result_cache_entries", "Entries currently tracked by the result cache LRU")
+
+def instrument_engine(engine):
+    """Time every statement run through `engine` (pass async_engine.sync_engine for an AsyncEngine)."""
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        DB_QUERY_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
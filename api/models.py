@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Index, text
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database import Base
@@ -9,19 +9,43 @@ class User(Base):
     username = Column(String, unique=True, index=True)
     hashed_password = Column(String)
     task_quota = Column(Integer, default=100) # Max total tasks allowed
+    tasks_used = Column(Integer, default=0, server_default="0", nullable=False) # Maintained counter, reconciled by reconcile_quota_counters
     is_admin = Column(Boolean, default=True)
     
     tasks = relationship("Task", back_populates="owner")
 
+class Schedule(Base):
+    """A recurring task: each firing creates `replicas` tasks from this spec (see worker/scheduler.py)."""
+    __tablename__ = "schedules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    cron = Column(String, nullable=False) # 5-field cron expression, evaluated in UTC
+    input_data = Column(Text, nullable=False)
+    input_ref = Column(String(64), nullable=True)
+    max_execution_time = Column(Integer, default=30)
+    task_type = Column(String, default="text_processing")
+    simulated_duration = Column(Integer, default=5)
+    priority = Column(String, default="normal", nullable=False)
+    replicas = Column(Integer, default=1, nullable=False)
+    next_run_at = Column(DateTime(timezone=True), nullable=False) # due time of the occurrence currently scheduled
+    is_active = Column(Boolean, default=True, nullable=False) # cleared by DELETE /schedules/{id} or when quota runs out
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # worker/scheduler.py looks for "is_active AND next_run_at <= now()" every tick
+    __table_args__ = (
+        Index("ix_schedules_active_next_run_at", "is_active", "next_run_at"),
+    )
+
 class Task(Base):
     __tablename__ = "tasks"
 
     id = Column(Integer, primary_key=True, index=True)
     input_data = Column(Text, nullable=False)
-    status = Column(String, default="Pending") # Pending, Processing, Completed, Failed, Cancelled
+    status = Column(String, default="Pending") # Waiting, Scheduled, Pending, Processing, Completed, Failed, Cancelled
     result = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now()) # Drives GET /tasks/changes
 
     # Phase 2
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=True) # Check
@@ -33,5 +57,36 @@ class Task(Base):
     
     # New: Explicit Duration Control
     simulated_duration = Column(Integer, default=5) # seconds to "work"
+
+    # Dispatch lane: high, normal or low; each lane is its own Redis stream
+    priority = Column(String, default="normal", server_default=text("'normal'"), nullable=False)
+
+    # Blob offload: payloads over BLOB_THRESHOLD live in the blob store; the text columns then hold a preview
+    input_ref = Column(String(64), nullable=True) # sha256 of the full input_data
+    result_ref = Column(String(64), nullable=True) # sha256 of the full result
+
+    # Delayed/recurring dispatch: Scheduled tasks wait in the schedule:due zset until run_at
+    run_at = Column(DateTime(timezone=True), nullable=True)
+    schedule_id = Column(Integer, ForeignKey("schedules.id"), nullable=True) # the recurring schedule that created this task
+
+    # DAGs: a Waiting task is released by the worker that completes its last unfinished parent
+    pending_parents = Column(Integer, default=0, server_default="0", nullable=False) # in-degree over unsatisfied edges
     
     owner = relationship("User", back_populates="tasks")
+
+    # Keyset pagination: every listing filter is paired with id so "WHERE ... AND id < cursor ORDER BY id DESC" stays an index range scan
+    __table_args__ = (
+        Index("ix_tasks_owner_id_id", "owner_id", "id"),
+        Index("ix_tasks_status_id", "status", "id"),
+        Index("ix_tasks_task_type_id", "task_type", "id"),
+        Index("ix_tasks_created_at_id", "created_at", "id"),
+        Index("ix_tasks_updated_at_id", "updated_at", "id"), # GET /tasks/changes pages on (updated_at, id)
+    )
+
+class TaskDependency(Base):
+    """DAG edge: child may only run once parent has completed."""
+    __tablename__ = "task_dependencies"
+
+    parent_id = Column(Integer, ForeignKey("tasks.id", ondelete="CASCADE"), primary_key=True) # PK prefix serves "children of"
+    child_id = Column(Integer, ForeignKey("tasks.id", ondelete="CASCADE"), primary_key=True, index=True)
+    satisfied = Column(Boolean, default=False, server_default="false", nullable=False) # set once, so a redelivered completion cannot decrement twice
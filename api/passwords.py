@@ -0,0 +1,12 @@
+# bcrypt helpers run inside the API's password process pool.
+# Kept out of main.py so pool processes, started fresh by forkserver, import only this and bcrypt.
+import os
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+def get_password_hash(password, rounds=BCRYPT_ROUNDS):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+def verify_password(plain_password, hashed_password):
+    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
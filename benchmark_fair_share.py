@@ -0,0 +1,119 @@
+import argparse
+import heapq
+import json
+import os
+import sys
+from collections import deque
+
+# The scheduler under test is the one the dispatcher service runs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker"))
+from dispatcher import DeficitRoundRobin
+
+# Discrete-event simulation of the worker pool: no Redis, Postgres or Docker needed.
+# tenant -> (tasks, submitted at second, seconds per task)
+SCENARIO = {
+    "bulk": (10000, 0.0, 1.0),
+    "medium": (200, 5.0, 1.0),
+    "small": (5, 10.0, 1.0),
+}
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def simulate(mode, scenario, slots, user_limit, quantum, buffer_target, tick):
+    """Returns tenant -> list of task latencies (completion - submission) in seconds.
+
+    fifo: every task goes straight onto the shared stream, as with FAIR_SHARE=0.
+    fair: tasks wait in per-tenant queues; every `tick` the DRR dispatcher tops the shared
+          stream up to `buffer_target` undelivered entries, respecting `user_limit`.
+    """
+    events = [] # (time, seq, kind, payload)
+    seq = 0
+    for tenant, (count, at, duration) in scenario.items():
+        heapq.heappush(events, (at, seq, "submit", tenant))
+        seq += 1
+    if mode == "fair":
+        heapq.heappush(events, (0.0, seq, "tick", None))
+        seq += 1
+
+    stream = deque() # (tenant, submitted_at)
+    queues = {tenant: deque() for tenant in scenario}
+    inflight = dict.fromkeys(scenario, 0)
+    drr = DeficitRoundRobin(quantum)
+    free = slots
+    latencies = {tenant: [] for tenant in scenario}
+    remaining = sum(count for count, _, _ in scenario.values())
+
+    while events and remaining:
+        now, _, kind, payload = heapq.heappop(events)
+        if kind == "submit":
+            count, _, _ = scenario[payload]
+            target = stream if mode == "fifo" else queues[payload]
+            target.extend((payload, now) for _ in range(count))
+        elif kind == "done":
+            tenant, submitted = payload
+            latencies[tenant].append(now - submitted)
+            inflight[tenant] -= 1
+            free += 1
+            remaining -= 1
+        elif kind == "tick":
+            backlog = {t: len(q) for t, q in queues.items() if q}
+            headroom = {t: user_limit - inflight[t] - sum(1 for s, _ in stream if s == t) for t in backlog}
+            plan = drr.plan(backlog, headroom, max(0, buffer_target - len(stream)))
+            for tenant, n in plan.items():
+                for _ in range(n):
+                    stream.append(queues[tenant].popleft())
+            heapq.heappush(events, (now + tick, seq, "tick", None))
+            seq += 1
+
+        # Free slots take the oldest undelivered entries, as XREADGROUP ">" does
+        while free and stream:
+            tenant, submitted = stream.popleft()
+            free -= 1
+            inflight[tenant] += 1
+            heapq.heappush(events, (now + scenario[tenant][2], seq, "done", (tenant, submitted)))
+            seq += 1
+    return latencies
+
+def summarize(latencies):
+    return {
+        tenant: {
+            "tasks": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": max(values),
+        }
+        for tenant, values in latencies.items() if values
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-tenant latency under FIFO vs fair-share dispatch")
+    parser.add_argument("--slots", type=int, default=20, help="Total worker slots")
+    parser.add_argument("--user-limit", type=int, default=20, help="USER_CONCURRENCY_LIMIT")
+    parser.add_argument("--quantum", type=int, default=1, help="FAIR_QUANTUM")
+    parser.add_argument("--buffer", type=int, default=10, help="FAIR_STREAM_TARGET")
+    parser.add_argument("--tick", type=float, default=0.2, help="FAIR_TICK in seconds")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    results = {
+        mode: summarize(simulate(mode, SCENARIO, args.slots, args.user_limit, args.quantum, args.buffer, args.tick))
+        for mode in ("fifo", "fair")
+    }
+
+    if args.json:
+        print(json.dumps({"config": vars(args), "scenario": SCENARIO, "results": results}, indent=2))
+        return
+
+    print(f"[BENCH] {args.slots} slots, user limit {args.user_limit}, quantum {args.quantum}, buffer {args.buffer}")
+    for tenant, (count, at, duration) in SCENARIO.items():
+        print(f"[BENCH] {tenant}: {count} tasks of {duration}s submitted at t={at}s")
+    print(f"{'mode':<6}{'tenant':<8}{'tasks':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for mode, tenants in results.items():
+        for tenant, s in tenants.items():
+            print(f"{mode:<6}{tenant:<8}{s['tasks']:>7}{s['p50']:>10.1f}{s['p95']:>10.1f}{s['p99']:>10.1f}{s['max']:>10.1f}")
+
+if __name__ == "__main__":
+    main()
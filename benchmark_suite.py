@@ -0,0 +1,307 @@
+"""Reproducible load test for the API and the workers, without Docker or nginx.
+
+The FastAPI app runs in this process (through its ASGI test client) and every worker is a real
+`worker/worker.py` process, all against the same Postgres and Redis:
+
+  --backend local     DATABASE_URL / REDIS_HOST / REDIS_PORT from the environment, e.g.
+                      docker run -p 5432:5432 -e POSTGRES_PASSWORD=password postgres:15 and docker run -p 6379:6379 redis:7
+  --backend embedded  a private Postgres and Redis started from pip packages (pip install pgserver redislite)
+
+The suite is destructive: every scenario starts with /admin/reset-system. Point it at scratch databases only.
+
+For each (replicas, workers) scenario it reports dispatch throughput, end-to-end latency percentiles
+(created_at -> final status), worker slot utilization and DB work per task. Replicas share their
+input, so workers run with RESULT_CACHE=0: every task executes instead of being coalesced. --json writes the results,
+and --baseline compares them with an earlier run and exits 1 on a regression.
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(ROOT, "api")
+WORKER_DIR = os.path.join(ROOT, "worker")
+
+def log(msg):
+    print(f"[BENCH] {msg}", flush=True)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def start_backend(kind, workdir):
+    """Return (env overrides, cleanup callable) for the chosen backend."""
+    if kind == "local":
+        return {}, lambda: None
+    try:
+        import pgserver
+        import redislite
+    except ImportError:
+        sys.exit("--backend embedded needs: pip install pgserver redislite")
+    pg = pgserver.get_server(os.path.join(workdir, "pgdata"), cleanup_mode="stop")
+    redis_port = free_port()
+    rd = redislite.Redis(os.path.join(workdir, "redis.db"), serverconfig={"port": str(redis_port)})
+
+    def cleanup():
+        rd.shutdown()
+        pg.cleanup()
+    return {"DATABASE_URL": pg.get_uri(), "REDIS_HOST": "127.0.0.1", "REDIS_PORT": str(redis_port)}, cleanup
+
+def scrape(port):
+    """Sum each sample of a worker's /metrics over its labels: name -> value."""
+    from prometheus_client.parser import text_string_to_metric_families
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+        text = response.read().decode()
+    totals = {}
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            totals[sample.name] = totals.get(sample.name, 0) + sample.value
+    return totals
+
+def api_db_statements():
+    import metrics # api/metrics.py, loaded with the app
+    return sum(s.value for m in metrics.DB_QUERY_SECONDS.collect() for s in m.samples if s.name.endswith("_count"))
+
+class Workers:
+    """`count` worker processes with their own consumer names and metrics ports."""
+    def __init__(self, count, env, logdir):
+        self.procs, self.ports = [], []
+        for i in range(count):
+            port = free_port()
+            worker_env = {**env, "WORKER_NAME": f"bench-worker-{i}", "WORKER_METRICS_PORT": str(port)}
+            logfile = open(os.path.join(logdir, f"worker-{i}.log"), "ab")
+            self.procs.append(subprocess.Popen([sys.executable, "worker.py"], cwd=WORKER_DIR, env=worker_env,
+                                               stdout=logfile, stderr=subprocess.STDOUT))
+            self.ports.append(port)
+
+    def wait_ready(self, timeout=60):
+        deadline = time.time() + timeout
+        for proc, port in zip(self.procs, self.ports):
+            while True:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"Worker exited with code {proc.returncode}; see its log")
+                try:
+                    scrape(port)
+                    break
+                except OSError:
+                    if time.time() > deadline:
+                        raise RuntimeError("Workers did not start in time")
+                    time.sleep(0.2)
+
+    def metrics(self):
+        totals = {}
+        for port in self.ports:
+            for name, value in scrape(port).items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
+    def stop(self):
+        for proc in self.procs:
+            proc.terminate()
+        for proc in self.procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+def run_scenario(client, headers, engine, env, logdir, replicas, workers, args):
+    from sqlalchemy import text
+    client.post("/admin/reset-system", headers=headers).raise_for_status()
+    pool = Workers(workers, env, logdir)
+    try:
+        pool.wait_ready()
+
+        # 1. Dispatch: whole requests of `replicas` until --tasks tasks exist
+        requests_needed = max(1, args.tasks // replicas)
+        total = requests_needed * replicas
+        statements_before = api_db_statements()
+        request_seconds = []
+        started = time.perf_counter()
+        for i in range(requests_needed):
+            t0 = time.perf_counter()
+            response = client.post("/tasks", headers=headers, json={
+                "input_data": f"bench-{replicas}x{workers}-{i}",
+                "task_type": args.task_type,
+                "simulated_duration": args.duration,
+                "max_execution_time": max(30, args.duration * 10),
+                "replicas": replicas,
+            })
+            response.raise_for_status()
+            request_seconds.append(time.perf_counter() - t0)
+        dispatch_seconds = time.perf_counter() - started
+        api_statements = api_db_statements() - statements_before
+
+        # 2. Wait for every task to reach a final status
+        with engine.connect() as conn:
+            while True:
+                done = conn.execute(text("SELECT count(*) FROM tasks WHERE status IN ('Completed', 'Failed')")).scalar()
+                conn.commit()
+                if done >= total:
+                    break
+                if time.perf_counter() - started > args.timeout:
+                    raise RuntimeError(f"Only {done}/{total} tasks finished within {args.timeout}s")
+                time.sleep(0.1)
+            wall_seconds = time.perf_counter() - started
+            latencies = [row[0] for row in conn.execute(text(
+                "SELECT EXTRACT(EPOCH FROM updated_at - created_at)::float FROM tasks"
+            ))]
+            failed = conn.execute(text("SELECT count(*) FROM tasks WHERE status = 'Failed'")).scalar()
+
+        # 3. Worker-side counters for this scenario only (fresh processes)
+        m = pool.metrics()
+    finally:
+        pool.stop()
+
+    busy = m.get("worker_task_duration_seconds_sum", 0)
+    slots = m.get("worker_slots_total", 0)
+    return {
+        "replicas": replicas,
+        "workers": workers,
+        "tasks": total,
+        "failed": int(failed),
+        "dispatch_tasks_per_sec": round(total / dispatch_seconds, 1),
+        "dispatch_request_ms": {
+            "p50": round(percentile(request_seconds, 50) * 1000, 2),
+            "p95": round(percentile(request_seconds, 95) * 1000, 2),
+        },
+        "end_to_end_s": {p: round(percentile(latencies, q), 3) for p, q in (("p50", 50), ("p95", 95), ("p99", 99), ("max", 100))},
+        "completed_tasks_per_sec": round(total / wall_seconds, 1),
+        "queue_wait_mean_s": round(m.get("worker_queue_wait_seconds_sum", 0) / max(1, m.get("worker_queue_wait_seconds_count", 0)), 3),
+        "worker_utilization": round(busy / (slots * wall_seconds), 4) if slots else None,
+        "api_db_statements_per_task": round(api_statements / total, 3),
+        "worker_db_transactions_per_task": round(m.get("worker_db_transaction_duration_seconds_count", 0) / total, 3),
+        "status_flushes": int(m.get("worker_status_flush_batch_size_count", 0)),
+    }
+
+# (key path, higher is better)
+REGRESSION_CHECKS = [
+    (("dispatch_tasks_per_sec",), True),
+    (("end_to_end_s", "p95"), False),
+    (("api_db_statements_per_task",), False),
+    (("worker_db_transactions_per_task",), False),
+]
+
+def compare(results, baseline, tolerance):
+    """Human-readable regressions of `results` against `baseline` beyond `tolerance` (a fraction)."""
+    previous = {(s["replicas"], s["workers"]): s for s in baseline["scenarios"]}
+    regressions = []
+    for scenario in results["scenarios"]:
+        before = previous.get((scenario["replicas"], scenario["workers"]))
+        if not before:
+            continue
+        for path, higher_is_better in REGRESSION_CHECKS:
+            new, old = scenario, before
+            for key in path:
+                new, old = new.get(key), old.get(key)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                regressions.append(f"replicas={scenario['replicas']} workers={scenario['workers']} "
+                                   f"{'.'.join(path)}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process API + worker benchmark")
+    parser.add_argument("--backend", choices=("local", "embedded"), default="embedded")
+    parser.add_argument("--replicas", default="1,10,100", help="Comma-separated replicas per POST /tasks")
+    parser.add_argument("--workers", default="1,2", help="Comma-separated worker process counts")
+    parser.add_argument("--slots", type=int, default=32, help="WORKER_CONCURRENCY per worker")
+    parser.add_argument("--tasks", type=int, default=500, help="Tasks per scenario")
+    parser.add_argument("--duration", type=int, default=1, help="simulated_duration of each task (s, >= 1: the worker treats 0 as 5)")
+    parser.add_argument("--task-type", default="text_processing")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds before a scenario is abandoned")
+    parser.add_argument("--json", help="Write machine-readable results to this path")
+    parser.add_argument("--baseline", help="Earlier --json output to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression")
+    args = parser.parse_args()
+    if args.duration < 1:
+        parser.error("--duration must be at least 1")
+
+    workdir = tempfile.mkdtemp(prefix="resilienttask-bench-")
+    backend_env, cleanup = start_backend(args.backend, workdir)
+    env = {
+        **os.environ,
+        **backend_env,
+        "BLOB_DIR": os.path.join(workdir, "blobs"),
+        "WORKER_CONCURRENCY": str(args.slots),
+        "HANDLER_PROCESSES": os.getenv("HANDLER_PROCESSES", "2"),
+        "RESULT_CACHE": "0", # measure execution, not single-flight coalescing of identical replicas
+        "PYTHONUNBUFFERED": "1",
+    }
+    # The API reads its configuration at import time
+    os.environ.update({k: v for k, v in env.items() if k in backend_env or k == "BLOB_DIR"})
+    sys.path.insert(0, API_DIR)
+    try:
+        import main as api
+        from fastapi.testclient import TestClient
+        from sqlalchemy import text
+
+        results = {
+            "backend": args.backend,
+            "config": {k: v for k, v in vars(args).items() if k not in ("json", "baseline")},
+            "python": sys.version.split()[0],
+            "cpus": os.cpu_count(),
+            "result_cache": False,
+            "scenarios": [],
+        }
+        with TestClient(api.app) as client:
+            client.post("/signup", json={"username": "bench", "password": "bench"})
+            token = client.post("/login", json={"username": "bench", "password": "bench"}).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+            with api.engine.begin() as conn:
+                conn.execute(text("UPDATE users SET task_quota = 1000000000, is_admin = true WHERE username = 'bench'"))
+            # Admin rights are baked into the token at login
+            token = client.post("/login", json={"username": "bench", "password": "bench"}).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+
+            for workers in [int(w) for w in args.workers.split(",")]:
+                for replicas in [int(r) for r in args.replicas.split(",")]:
+                    log(f"replicas={replicas} workers={workers} ...")
+                    scenario = run_scenario(client, headers, api.engine, env, workdir, replicas, workers, args)
+                    results["scenarios"].append(scenario)
+                    log(f"  dispatch {scenario['dispatch_tasks_per_sec']} tasks/s, "
+                        f"e2e p50/p95 {scenario['end_to_end_s']['p50']}/{scenario['end_to_end_s']['p95']}s, "
+                        f"utilization {scenario['worker_utilization']}, "
+                        f"DB/task api {scenario['api_db_statements_per_task']} worker {scenario['worker_db_transactions_per_task']}")
+    finally:
+        cleanup()
+
+    print(f"Workers ran with RESULT_CACHE=0 ({args.task_type}, {args.duration}s per task, {args.slots} slots each)")
+    print(f"{'replicas':>8}{'workers':>8}{'tasks':>7}{'disp/s':>9}{'done/s':>9}{'e2e p50':>9}{'e2e p95':>9}{'util':>7}{'api db':>8}{'wrk db':>8}")
+    for s in results["scenarios"]:
+        print(f"{s['replicas']:>8}{s['workers']:>8}{s['tasks']:>7}{s['dispatch_tasks_per_sec']:>9}{s['completed_tasks_per_sec']:>9}"
+              f"{s['end_to_end_s']['p50']:>9}{s['end_to_end_s']['p95']:>9}{s['worker_utilization'] or 0:>7.2f}"
+              f"{s['api_db_statements_per_task']:>8}{s['worker_db_transactions_per_task']:>8}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        log(f"Results written to {args.json}")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            log(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        log(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 "use client";
 
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import { useRouter } from "next/navigation";
 
 // Types
@@ -15,10 +15,32 @@ type Task = {
   owner_id: number;
   task_type: string;
   simulated_duration: number;
+  priority: string;
+  input_ref: string | null;
+  result_ref: string | null;
+  run_at?: string | null;
+  schedule_id?: number | null;
+  pending_parents?: number;
+};
+
+type TaskChanges = {
+  tasks: Task[];
+  cursor: string | null;
+  has_more: boolean;
+  status_counts: Record<string, number> | null;
 };
 
 // API Helper
 const API_URL = "http://localhost:8080";
+const FEED_SIZE = 100;
+const MAX_CHANGE_PAGES = 5; // Beyond this many pages per poll a fresh snapshot is cheaper
+
+const toStats = (counts: Record<string, number>) => ({
+  active: (counts["Pending"] || 0) + (counts["Processing"] || 0),
+  completed: counts["Completed"] || 0,
+  failed: counts["Failed"] || 0,
+  cancelled: counts["Cancelled"] || 0
+});
 
 export default function Home() {
   const router = useRouter();
@@ -29,6 +51,9 @@ export default function Home() {
   const [duration, setDuration] = useState(5);
   const [replicas, setReplicas] = useState(1);
   const [taskType, setTaskType] = useState("text_processing");
+  const [priority, setPriority] = useState("auto");
+  const [runAt, setRunAt] = useState(""); // datetime-local, empty = now
+  const [cron, setCron] = useState(""); // e.g. "*/5 * * * *", empty = one-off
   const [loading, setLoading] = useState(false);
   const [token, setToken] = useState<string | null>(null);
   const [username, setUsername] = useState<string>("");
@@ -81,25 +106,20 @@ export default function Home() {
     }
   }, [router]);
 
+  // Cursor into GET /tasks/changes; null forces a full snapshot
+  const changesCursor = useRef<string | null>(null);
+
   const fetchTasks = async () => {
     if (!token) return;
     try {
-      const res = await fetch(`${API_URL}/tasks?limit=100`, { // Fetch more for stats
+      const res = await fetch(`${API_URL}/tasks/changes?limit=${FEED_SIZE}`, {
         headers: { Authorization: `Bearer ${token}` },
       });
       if (res.ok) {
-        const data = await res.json();
-        setTasks(data);
-
-        // Compute Stats
-        const s = { active: 0, completed: 0, failed: 0, cancelled: 0 };
-        data.forEach((t: Task) => {
-          if (t.status === 'Processing' || t.status === 'Pending') s.active++;
-          else if (t.status === 'Completed') s.completed++;
-          else if (t.status === 'Failed') s.failed++;
-          else if (t.status === 'Cancelled') s.cancelled++;
-        });
-        setStats(s);
+        const data: TaskChanges = await res.json();
+        setTasks(data.tasks);
+        changesCursor.current = data.cursor;
+        if (data.status_counts) setStats(toStats(data.status_counts));
 
       } else if (res.status === 401) {
         router.push("/login");
@@ -109,6 +129,52 @@ export default function Home() {
     }
   };
 
+  // Idle polls return an empty body; only changed rows are merged into the feed
+  const pollChanges = async () => {
+    if (!token) return;
+    if (!changesCursor.current) {
+      fetchTasks();
+      return;
+    }
+    try {
+      // Follow has_more pages (keyset on updated_at, id) until caught up
+      let cursor: string = changesCursor.current;
+      const changed: Task[] = [];
+      let counts: Record<string, number> | null = null;
+      for (let page = 0; ; page++) {
+        if (page === MAX_CHANGE_PAGES) {
+          fetchTasks();
+          return;
+        }
+        const res = await fetch(`${API_URL}/tasks/changes?limit=${FEED_SIZE}&since=${encodeURIComponent(cursor)}`, {
+          headers: { Authorization: `Bearer ${token}` },
+        });
+        if (res.status === 401) {
+          router.push("/login");
+          return;
+        }
+        if (!res.ok) return;
+        const data: TaskChanges = await res.json();
+        changed.push(...data.tasks);
+        if (data.status_counts) counts = data.status_counts;
+        cursor = data.cursor ?? cursor;
+        if (!data.has_more) break;
+      }
+      changesCursor.current = cursor;
+      if (changed.length === 0) return;
+
+      setTasks(prev => {
+        const merged = new Map(prev.map(t => [t.id, t]));
+        changed.forEach(t => merged.set(t.id, t));
+        return Array.from(merged.values()).sort((a, b) => b.id - a.id).slice(0, FEED_SIZE);
+      });
+      if (counts) setStats(toStats(counts));
+      fetchQuota();
+    } catch (err) {
+      console.error("Poll changes failed", err);
+    }
+  };
+
   const fetchQuota = async () => {
     if (!token) return;
     try {
@@ -137,11 +203,34 @@ export default function Home() {
     if (token) {
       fetchTasks();
       fetchQuota();
+
+      // Live stream: apply status transitions as they happen, then pull counts/new rows once things settle
+      let streamLive = false;
+      let resync: ReturnType<typeof setTimeout> | null = null;
+      let lastPoll = Date.now();
+      const source = new EventSource(`${API_URL}/tasks/stream?token=${encodeURIComponent(token)}`);
+      source.onopen = () => { streamLive = true; };
+      source.onerror = () => { streamLive = false; };
+      source.addEventListener("task", (e) => {
+        const event = JSON.parse((e as MessageEvent).data);
+        setTasks(prev => prev.map(t => t.id === event.task_id
+          ? { ...t, status: event.status, result: event.result ?? t.result }
+          : t));
+        if (resync) clearTimeout(resync);
+        resync = setTimeout(() => { lastPoll = Date.now(); pollChanges(); }, 1000);
+      });
+
+      // Polling is the fallback; while the stream is up it only runs as a slow safety net
       const interval = setInterval(() => {
-        fetchTasks();
-        fetchQuota();
+        if (streamLive && Date.now() - lastPoll < 30000) return;
+        lastPoll = Date.now();
+        pollChanges();
       }, 5000);
-      return () => clearInterval(interval);
+      return () => {
+        clearInterval(interval);
+        if (resync) clearTimeout(resync);
+        source.close();
+      };
     }
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [token]);
@@ -158,20 +247,24 @@ export default function Home() {
     const currentMaxTime = maxTime;
     const currentDuration = duration;
     const currentType = taskType;
+    const currentPriority = priority === "auto" ? undefined : priority;
+    const currentRunAt = runAt ? new Date(runAt).toISOString() : undefined;
+    const currentCron = cron.trim() || undefined;
 
     const previews: Task[] = [];
     for (let i = 0; i < replicas; i++) {
       previews.push({
         id: Date.now() + i, // Temp ID
         input_data: currentInput + (replicas > 1 ? ` (Replica #${i + 1})` : ""),
-        status: "Pending",
+        status: currentRunAt || currentCron ? "Scheduled" : "Pending",
         result: null,
         created_at: new Date().toISOString(),
         max_execution_time: currentMaxTime,
         is_cancelled: false,
         owner_id: 0,
         task_type: currentType,
-        simulated_duration: currentDuration
+        simulated_duration: currentDuration,
+        priority: currentPriority || "normal"
       });
     }
 
@@ -192,7 +285,10 @@ export default function Home() {
           max_execution_time: currentMaxTime,
           task_type: currentType,
           simulated_duration: currentDuration,
-          replicas: replicas
+          replicas: replicas,
+          priority: currentPriority,
+          run_at: currentRunAt,
+          cron: currentCron
         }),
       });
 
@@ -388,6 +484,12 @@ export default function Home() {
                   <p className="text-[10px] text-gray-500 uppercase mb-1">Max Timeout</p>
                   <p className="text-sm font-bold">{selectedTask.max_execution_time}s</p>
                 </div>
+                {selectedTask.run_at && (
+                  <div className="p-3 bg-white/5 rounded-xl border border-white/5">
+                    <p className="text-[10px] text-gray-500 uppercase mb-1">{selectedTask.schedule_id ? `Schedule #${selectedTask.schedule_id}` : 'Scheduled For'}</p>
+                    <p className="text-sm font-bold">{new Date(selectedTask.run_at).toLocaleString()}</p>
+                  </div>
+                )}
               </div>
 
               <div>
@@ -395,6 +497,14 @@ export default function Home() {
                 <div className="p-4 bg-black/40 rounded-xl font-mono text-xs border border-white/5 text-gray-300 break-all">
                   {selectedTask.input_data}
                 </div>
+                {selectedTask.input_ref && (
+                  <a
+                    href={`${API_URL}/tasks/${selectedTask.id}/input?token=${encodeURIComponent(token || "")}`}
+                    className="inline-block mt-2 text-[10px] text-indigo-400 hover:text-indigo-300 uppercase font-bold"
+                  >
+                    Preview only · Download full input
+                  </a>
+                )}
               </div>
 
               {selectedTask.result && (
@@ -403,6 +513,14 @@ export default function Home() {
                   <pre className="p-4 bg-green-500/5 rounded-xl font-mono text-xs border border-green-500/10 text-green-200 whitespace-pre-wrap">
                     {selectedTask.result}
                   </pre>
+                  {selectedTask.result_ref && (
+                    <a
+                      href={`${API_URL}/tasks/${selectedTask.id}/result?token=${encodeURIComponent(token || "")}`}
+                      className="inline-block mt-2 text-[10px] text-green-400 hover:text-green-300 uppercase font-bold"
+                    >
+                      Preview only · Download full result
+                    </a>
+                  )}
                 </div>
               )}
 
@@ -603,6 +721,21 @@ export default function Home() {
                         </div>
                       </div>
 
+                      <div className="space-y-2">
+                        <label className="text-[10px] uppercase font-bold text-gray-500 tracking-tighter">Priority Lane</label>
+                        <div className="grid grid-cols-4 gap-2">
+                          {['auto', 'high', 'normal', 'low'].map(p => (
+                            <button
+                              key={p} type="button" onClick={() => setPriority(p)}
+                              className={`p-2 rounded-xl text-xs font-bold border transition-all capitalize
+                                ${priority === p ? 'bg-indigo-500/10 border-indigo-500/50 text-indigo-400 shadow-lg' : 'bg-white/5 border-white/5 text-gray-500 hover:bg-white/10'}`}
+                            >
+                              {p}
+                            </button>
+                          ))}
+                        </div>
+                      </div>
+
                       <div className="space-y-4">
                         <div>
                           <div className="flex justify-between mb-2">
@@ -637,6 +770,24 @@ export default function Home() {
                             className="w-full h-1.5 bg-indigo-500/20 rounded-lg appearance-none cursor-pointer accent-indigo-500"
                           />
                         </div>
+                        <div className="grid grid-cols-2 gap-2">
+                          <div>
+                            <label className="block text-[10px] uppercase font-bold text-gray-500 mb-2">Run At (optional)</label>
+                            <input
+                              type="datetime-local" value={runAt}
+                              onChange={(e) => setRunAt(e.target.value)}
+                              className="w-full p-2 rounded-xl glass-input text-xs font-mono"
+                            />
+                          </div>
+                          <div>
+                            <label className="block text-[10px] uppercase font-bold text-gray-500 mb-2">Repeat (cron, UTC)</label>
+                            <input
+                              type="text" value={cron} placeholder="*/5 * * * *"
+                              onChange={(e) => setCron(e.target.value)}
+                              className="w-full p-2 rounded-xl glass-input text-xs font-mono"
+                            />
+                          </div>
+                        </div>
                         <div>
                           <label className="block text-[10px] uppercase font-bold text-gray-500 mb-2">Input Instructions</label>
                           <textarea
@@ -674,7 +825,7 @@ export default function Home() {
                           value={filterStatus} onChange={e => setFilterStatus(e.target.value)}
                           className="bg-black/40 border border-white/10 rounded-lg px-3 py-1.5 text-gray-300 outline-none focus:border-indigo-500/50"
                         >
-                          {['All', 'Active', 'Completed', 'Failed', 'Cancelled'].map(s => <option key={s} value={s} className="bg-gray-800">{s} Status</option>)}
+                          {['All', 'Active', 'Waiting', 'Scheduled', 'Completed', 'Failed', 'Cancelled'].map(s => <option key={s} value={s} className="bg-gray-800">{s} Status</option>)}
                         </select>
                         <select
                           value={filterType} onChange={e => setFilterType(e.target.value)}
@@ -721,7 +872,9 @@ export default function Home() {
                                     task.status === 'Processing' ? 'bg-blue-500 animate-pulse' :
                                       task.status === 'Failed' ? 'bg-orange-500' :
                                         task.status === 'Cancelled' ? 'bg-red-500' :
-                                          'bg-yellow-500'}`} />
+                                          task.status === 'Scheduled' ? 'bg-purple-500' :
+                                            task.status === 'Waiting' ? 'bg-gray-500' :
+                                              'bg-yellow-500'}`} />
                                 <span className="text-[10px] text-gray-500 uppercase tracking-widest font-bold">{task.status}</span>
                                 <span className="text-[10px] text-gray-600 font-mono pl-2 border-l border-white/10">{task.simulated_duration}s duration</span>
                               </div>
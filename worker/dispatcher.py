@@ -0,0 +1,214 @@
+import redis
+import json
+import os
+import time
+import socket
+import uuid
+from collections import deque
+
+# Configuration
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+GROUP_NAME = "task_workers"
+DISPATCHER_NAME = f"{socket.gethostname()}-{uuid.uuid4().hex[:6]}"
+# Lanes, mirroring api/main.py and worker.py
+LANE_STREAMS = {"high": "task_stream:high", "normal": "task_stream", "low": "task_stream:low"}
+# Fair share: the API queues tasks per owner; this dispatcher releases them into the lane streams
+FAIR_QUEUE_KEY = "fair:{}:{}" # lane, owner_id -> list of JSON stream entries
+FAIR_OWNERS_KEY = "fair:{}:owners" # lane -> set of owners with a backlog
+FAIR_INFLIGHT_KEY = "fair:inflight" # owner_id -> released but not yet finished (workers decrement)
+FAIR_LIMITS_KEY = "fair:limits" # owner_id -> per-user concurrency override
+FAIR_LEADER_KEY = "fair:leader"
+USER_CONCURRENCY_LIMIT = int(os.getenv("USER_CONCURRENCY_LIMIT", "20")) # max in-flight tasks per user
+FAIR_QUANTUM = int(os.getenv("FAIR_QUANTUM", "1")) # tasks credited to each owner per DRR round
+FAIR_STREAM_TARGET = int(os.getenv("FAIR_STREAM_TARGET", "200")) # undelivered entries to keep buffered per lane
+FAIR_TICK = float(os.getenv("FAIR_TICK", "0.2")) # seconds between dispatch rounds
+LEADER_TTL_MS = int(os.getenv("LEADER_TTL_MS", "5000"))
+# Tasks released outside the API (scheduler, DAG children) must be queued exactly as the API would
+FAIR_SHARE = os.getenv("FAIR_SHARE", "0") == "1"
+EMBED_TASK_SPEC = os.getenv("EMBED_TASK_SPEC", "1") == "1"
+MAX_EMBEDDED_SPEC_BYTES = int(os.getenv("MAX_EMBEDDED_SPEC_BYTES", "4096"))
+
+# Atomically move up to n entries from an owner's queue into the lane stream and count them in flight.
+# KEYS: queue, stream, inflight hash, owners set. ARGV: n, owner_id
+RELEASE_SCRIPT = """
+local items = redis.call('LPOP', KEYS[1], ARGV[1])
+if not items then
+    redis.call('SREM', KEYS[4], ARGV[2])
+    return 0
+end
+for _, raw in ipairs(items) do
+    local args = {'fair_owner', ARGV[2]}
+    for k, v in pairs(cjson.decode(raw)) do
+        table.insert(args, k)
+        table.insert(args, tostring(v))
+    end
+    redis.call('XADD', KEYS[2], '*', unpack(args))
+end
+redis.call('HINCRBY', KEYS[3], ARGV[2], #items)
+if redis.call('LLEN', KEYS[1]) == 0 then
+    redis.call('SREM', KEYS[4], ARGV[2])
+end
+return #items
+"""
+
+# Keep leadership only if we still hold it
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+def stream_fields(task_id, owner_id, input_data, max_time, task_type, duration, input_ref):
+    """Stream entry for a task, mirroring api/main.py stream_fields()."""
+    fields = {"task_id": str(task_id)}
+    if EMBED_TASK_SPEC:
+        spec = [input_data, max_time, task_type, duration, owner_id]
+        if input_ref:
+            spec.append(input_ref)
+        spec = json.dumps(spec, separators=(",", ":"))
+        if len(spec.encode()) <= MAX_EMBEDDED_SPEC_BYTES:
+            fields["spec"] = spec
+    return fields
+
+def enqueue(pipe, owner_id, priority, fields):
+    """Queue a task on `pipe`: its owner's fair-share queue with FAIR_SHARE, else straight into its lane stream."""
+    if FAIR_SHARE:
+        pipe.rpush(FAIR_QUEUE_KEY.format(priority, owner_id), json.dumps(fields))
+        pipe.sadd(FAIR_OWNERS_KEY.format(priority), owner_id)
+    else:
+        pipe.xadd(LANE_STREAMS[priority], fields)
+
+class DeficitRoundRobin:
+    """Deficit round-robin across owners.
+
+    Every visit credits an owner `quantum` tasks; it may release while it has credit, backlog and
+    concurrency headroom. Owners that are capped or empty earn no credit, so a tenant with 10,000
+    queued tasks gets the same turn as a tenant with 5. The ring position persists across calls.
+    """
+    def __init__(self, quantum=1):
+        self.quantum = quantum
+        self.deficit = {}
+        self.ring = deque()
+
+    def plan(self, backlog, headroom, budget):
+        """backlog/headroom: owner -> count. Returns owner -> tasks to release, at most budget in total."""
+        for owner in backlog:
+            if owner not in self.deficit:
+                self.deficit[owner] = 0
+                self.ring.append(owner)
+        backlog = dict(backlog)
+        headroom = dict(headroom)
+        release = {}
+
+        while budget > 0:
+            progressed = False
+            for _ in range(len(self.ring)):
+                owner = self.ring[0]
+                self.ring.rotate(-1)
+                if backlog.get(owner, 0) <= 0:
+                    # Idle owners leave the ring and lose their credit
+                    self.ring.remove(owner)
+                    self.deficit.pop(owner, None)
+                    continue
+                if headroom.get(owner, 0) <= 0:
+                    continue
+                self.deficit[owner] += self.quantum
+                n = min(self.deficit[owner], backlog[owner], headroom[owner], budget)
+                if n <= 0:
+                    continue
+                release[owner] = release.get(owner, 0) + n
+                self.deficit[owner] -= n
+                backlog[owner] -= n
+                headroom[owner] -= n
+                budget -= n
+                progressed = True
+                if budget <= 0:
+                    break
+            if not progressed:
+                break
+        return release
+
+def lane_budget(r, stream):
+    """How many entries the lane can take before its undelivered backlog exceeds FAIR_STREAM_TARGET."""
+    try:
+        groups = r.xinfo_groups(stream)
+    except redis.exceptions.ResponseError:
+        return FAIR_STREAM_TARGET # stream not created yet
+    lag = max((g.get("lag") or 0 for g in groups if g["name"] == GROUP_NAME), default=0)
+    return max(0, FAIR_STREAM_TARGET - lag)
+
+def dispatch_round(r, release_script, schedulers):
+    lane_owners = {}
+    pipe = r.pipeline(transaction=False)
+    for lane in LANE_STREAMS:
+        pipe.smembers(FAIR_OWNERS_KEY.format(lane))
+    for lane, owners in zip(LANE_STREAMS, pipe.execute()):
+        if owners:
+            lane_owners[lane] = sorted(owners, key=int)
+    if not lane_owners:
+        return 0
+
+    all_owners = sorted({o for owners in lane_owners.values() for o in owners}, key=int)
+    pipe = r.pipeline(transaction=False)
+    pipe.hmget(FAIR_INFLIGHT_KEY, all_owners)
+    pipe.hmget(FAIR_LIMITS_KEY, all_owners)
+    for lane, owners in lane_owners.items():
+        for owner in owners:
+            pipe.llen(FAIR_QUEUE_KEY.format(lane, owner))
+    results = pipe.execute()
+    inflight, limits, lengths = results[0], results[1], iter(results[2:])
+
+    # Concurrency headroom is per user across all lanes
+    headroom = {
+        owner: (int(limit) if limit else USER_CONCURRENCY_LIMIT) - max(0, int(count or 0))
+        for owner, count, limit in zip(all_owners, inflight, limits)
+    }
+
+    released = 0
+    # Higher lanes spend the shared headroom first
+    for lane, owners in lane_owners.items():
+        backlog = {owner: next(lengths) for owner in owners}
+        plan = schedulers[lane].plan(backlog, headroom, lane_budget(r, LANE_STREAMS[lane]))
+        for owner, n in plan.items():
+            moved = release_script(
+                keys=[FAIR_QUEUE_KEY.format(lane, owner), LANE_STREAMS[lane], FAIR_INFLIGHT_KEY, FAIR_OWNERS_KEY.format(lane)],
+                args=[n, owner],
+            )
+            headroom[owner] -= moved
+            released += moved
+    return released
+
+def main():
+    r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
+    release_script = r.register_script(RELEASE_SCRIPT)
+    renew_script = r.register_script(RENEW_SCRIPT)
+    schedulers = {lane: DeficitRoundRobin(FAIR_QUANTUM) for lane in LANE_STREAMS}
+    leader = False
+
+    print(f"[{DISPATCHER_NAME}] Fair-share dispatcher started (limit {USER_CONCURRENCY_LIMIT}/user, quantum {FAIR_QUANTUM})")
+
+    while True:
+        try:
+            # Single active dispatcher: standbys wait for the lease to lapse
+            if leader:
+                leader = bool(renew_script(keys=[FAIR_LEADER_KEY], args=[DISPATCHER_NAME, LEADER_TTL_MS]))
+            else:
+                leader = bool(r.set(FAIR_LEADER_KEY, DISPATCHER_NAME, nx=True, px=LEADER_TTL_MS))
+                if leader:
+                    print(f"[{DISPATCHER_NAME}] Acquired dispatcher leadership")
+            if not leader:
+                time.sleep(LEADER_TTL_MS / 1000 / 2)
+                continue
+
+            released = dispatch_round(r, release_script, schedulers)
+            if released:
+                print(f"[{DISPATCHER_NAME}] Released {released} tasks")
+        except Exception as e:
+            print(f"[{DISPATCHER_NAME}] Dispatch Error: {e}")
+            leader = False
+        time.sleep(FAIR_TICK)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+import handlers
+
+# Sizing: threads cover every slot; processes default to one per core of the worker host
+HANDLER_THREADS = max(1, int(os.getenv("HANDLER_THREADS", os.getenv("WORKER_CONCURRENCY", "64"))))
+HANDLER_PROCESSES = max(1, int(os.getenv("HANDLER_PROCESSES", str(os.cpu_count() or 1))))
+
+# forkserver: replacement processes are forked from a clean server, not from this threaded process
+mp = multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+class HandlerFailed(Exception):
+    """The handler raised, or its process died; the message is what gets stored as the task result."""
+
+def handler_process_main(conn):
+    """Loop of a warm handler process: receive (task_type, input, context) and send back (ok, value)."""
+    while True:
+        try:
+            task_type, input_data, ctx_args = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        try:
+            handler = handlers.get_handler(task_type)
+            conn.send((True, handler.fn(input_data, handlers.TaskContext(**ctx_args))))
+        except Exception as e:
+            conn.send((False, f"{type(e).__name__}: {e}"))
+
+class HandlerProcess:
+    def __init__(self):
+        self.conn, child_conn = mp.Pipe()
+        self.process = mp.Process(target=handler_process_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+class ProcessPool:
+    """Warm, reused handler processes. A runaway one is killed and replaced, the rest keep running."""
+    def __init__(self, size):
+        self.size = size
+        self.idle = queue.Queue()
+        for _ in range(size):
+            self.idle.put(HandlerProcess())
+
+    def replace(self, proc):
+        proc.kill()
+        self.idle.put(HandlerProcess())
+
+class ProcessCall:
+    """A handler run in the pool; it waits for an idle process lazily, inside wait()."""
+    def __init__(self, pool, handler, input_data, ctx):
+        self.pool = pool
+        self.message = (handler.task_type, input_data, {"task_id": ctx.task_id, "task_type": ctx.task_type, "duration": ctx.duration})
+        self.proc = None
+        self.started_at = None # set once a process picks the call up; queueing does not count against max_execution_time
+
+    def wait(self, timeout):
+        if self.proc is None:
+            try:
+                self.proc = self.pool.idle.get(timeout=timeout)
+            except queue.Empty:
+                return False
+            self.proc.conn.send(self.message)
+            self.started_at = time.time()
+            return False
+        # poll() is also true when the process died, recv() then raises EOFError
+        return self.proc.conn.poll(timeout)
+
+    def result(self):
+        proc, self.proc = self.proc, None
+        try:
+            ok, value = proc.conn.recv()
+        except (EOFError, OSError):
+            self.pool.replace(proc)
+            raise HandlerFailed(f"Handler process exited with code {proc.process.exitcode}")
+        self.pool.idle.put(proc)
+        if not ok:
+            raise HandlerFailed(value)
+        return value
+
+    def abort(self):
+        if self.proc is not None:
+            self.pool.replace(self.proc)
+            self.proc = None
+
+class FutureCall:
+    """A thread or async handler; aborting is cooperative (abort event / coroutine cancellation)."""
+    def __init__(self, future, abort_event):
+        self.future = future
+        self.abort_event = abort_event
+        self.started_at = time.time()
+
+    def wait(self, timeout):
+        try:
+            self.future.exception(timeout=timeout)
+        except TimeoutError:
+            return False
+        except CancelledError:
+            pass
+        return True
+
+    def result(self):
+        try:
+            return self.future.result()
+        except Exception as e:
+            raise HandlerFailed(f"{type(e).__name__}: {e}")
+
+    def abort(self):
+        self.abort_event.set()
+        self.future.cancel()
+
+thread_pool = None
+event_loop = None
+process_pool = None
+executors_lock = threading.Lock()
+
+def start_executors():
+    """Warm up the handler pools; called once when the worker starts, before any task runs."""
+    global thread_pool, event_loop, process_pool
+    if thread_pool is not None:
+        return
+    with executors_lock:
+        if thread_pool is not None:
+            return
+        event_loop = asyncio.new_event_loop()
+        threading.Thread(target=event_loop.run_forever, daemon=True, name="handler-loop").start()
+        # Only pay for processes when some registered handler needs them
+        if any(h.execution == handlers.PROCESS for h in handlers.REGISTRY.values()):
+            process_pool = ProcessPool(HANDLER_PROCESSES)
+        # Assigned last: it is the "ready" flag checked without the lock
+        thread_pool = ThreadPoolExecutor(max_workers=HANDLER_THREADS, thread_name_prefix="handler")
+
+def start_handler(handler, input_data, ctx):
+    """Start `handler` on the pool its execution class asks for and return a call handle."""
+    start_executors()
+    if handler.execution == handlers.PROCESS:
+        return ProcessCall(process_pool, handler, input_data, ctx)
+    if handler.execution == handlers.ASYNC:
+        future = asyncio.run_coroutine_threadsafe(handler.fn(input_data, ctx), event_loop)
+    else:
+        future = thread_pool.submit(handler.fn, input_data, ctx)
+    return FutureCall(future, ctx.abort_event)
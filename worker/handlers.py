@@ -0,0 +1,97 @@
+import asyncio
+import hashlib
+import time
+
+# Execution classes a handler can declare
+ASYNC = "async"     # coroutine on the worker's shared event loop, for I/O-bound work
+THREAD = "thread"   # blocking function on the handler thread pool
+PROCESS = "process" # function in a warm handler process, for CPU-bound work (killed on timeout/cancel)
+EXECUTION_CLASSES = (ASYNC, THREAD, PROCESS)
+
+DEFAULT_TASK_TYPE = "text_processing" # used for task types nobody registered
+
+class TaskAborted(Exception):
+    """Raised inside cooperative (thread/async) handlers once their task is cancelled or timed out."""
+
+class TaskContext:
+    """What a handler sees besides its input: the task and its simulated workload."""
+    def __init__(self, task_id, task_type, duration, abort_event=None):
+        self.task_id = task_id
+        self.task_type = task_type
+        self.duration = duration
+        self.abort_event = abort_event # None in handler processes, which are killed instead
+
+    def check(self):
+        if self.abort_event is not None and self.abort_event.is_set():
+            raise TaskAborted(self.task_id)
+
+    def sleep(self, seconds):
+        """Blocking wait that returns early (raising TaskAborted) when the task is aborted."""
+        if self.abort_event is None:
+            time.sleep(seconds)
+        elif self.abort_event.wait(seconds):
+            raise TaskAborted(self.task_id)
+
+    async def asleep(self, seconds):
+        # Async handlers are aborted by cancelling their coroutine
+        await asyncio.sleep(seconds)
+
+class Handler:
+    def __init__(self, task_type, fn, execution, version, cacheable):
+        self.task_type = task_type
+        self.fn = fn
+        self.execution = execution
+        self.version = version
+        self.cacheable = cacheable # output depends only on input_data, so result_cache may reuse it
+
+REGISTRY = {}
+
+def register(task_type, execution=THREAD, version="1", cacheable=False):
+    """Decorator: @register("image_gen", execution=PROCESS). Bump version when the output changes.
+
+    cacheable=True opts a deterministic handler into the shared result cache (result_cache.py).
+    """
+    if execution not in EXECUTION_CLASSES:
+        raise ValueError(f"Unknown execution class {execution!r} for {task_type}")
+    def decorator(fn):
+        REGISTRY[task_type] = Handler(task_type, fn, execution, version, cacheable)
+        return fn
+    return decorator
+
+def get_handler(task_type):
+    return REGISTRY.get(task_type) or REGISTRY[DEFAULT_TASK_TYPE]
+
+# --- Built-in handlers ---------------------------------------------------------------
+# Module-level functions so handler processes can look them up by task_type after import.
+
+@register("text_processing", execution=THREAD, cacheable=True)
+def process_text(input_data, ctx):
+    ctx.sleep(ctx.duration)
+    return input_data[::-1]
+
+@register("code_analysis", execution=ASYNC, cacheable=True)
+async def analyze_code(input_data, ctx):
+    await ctx.asleep(ctx.duration)
+    lines = input_data.splitlines() or [""]
+    return f"{len(lines)} lines, {len(input_data.split())} tokens, longest line {max(len(l) for l in lines)} chars"
+
+def burn(input_data, seconds):
+    """CPU-bound stand-in for rendering: chain SHA-256 over the input for `seconds` of CPU time."""
+    digest = input_data.encode()
+    rounds = 0
+    deadline = time.process_time() + seconds
+    while time.process_time() < deadline:
+        for _ in range(10000):
+            digest = hashlib.sha256(digest).digest()
+        rounds += 10000
+    return rounds, digest.hex()[:16]
+
+@register("image_gen", execution=PROCESS)
+def generate_image(input_data, ctx):
+    rounds, digest = burn(input_data, ctx.duration)
+    return f"image {digest} ({rounds} rounds)"
+
+@register("video_gen", execution=PROCESS)
+def generate_video(input_data, ctx):
+    frames = [burn(f"{input_data}:{frame}", ctx.duration / 10)[1] for frame in range(10)]
+    return f"video {len(frames)} frames, last {frames[-1]}"
@@ -0,0 +1,31 @@
+# Prometheus metrics for a worker process, served on WORKER_METRICS_PORT by start_http_server.
+from prometheus_client import Counter, Gauge, Histogram
+
+DURATION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+TASK_SECONDS = Histogram(
+    "worker_task_duration_seconds", "Wall time from task start until its final status is handed to the status writer",
+    ["task_type", "outcome"], buckets=DURATION_BUCKETS,
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "worker_queue_wait_seconds", "Time between an entry entering its lane stream and a slot starting it",
+    ["lane"], buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600),
+)
+DB_SECONDS = Histogram(
+    "worker_db_transaction_duration_seconds", "Time inside a DB transaction, commit included",
+    ["operation"], buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "worker_db_pool_wait_seconds", "Time a slot waited to borrow a pooled connection",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+STATUS_FLUSH_BATCH = Histogram(
+    "worker_status_flush_batch_size", "Task status changes written per batched UPDATE",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500),
+)
+ENTRIES_CLAIMED = Counter("worker_entries_claimed_total", "Stream entries taken by this worker", ["lane", "kind"]) # kind: read, reclaimed
+ENTRIES_ACKED = Counter("worker_entries_acked_total", "Stream entries acknowledged", ["lane"])
+ENTRIES_DEAD_LETTERED = Counter("worker_entries_dead_lettered_total", "Entries moved to the DLQ", ["lane"])
+TASKS_SKIPPED = Counter("worker_tasks_skipped_total", "Deliveries dropped by the claim because their task was no longer Pending")
+SLOTS_BUSY = Gauge("worker_slots_busy", "Task slots currently running a task")
+SLOTS_TOTAL = Gauge("worker_slots_total", "Configured task slots (WORKER_CONCURRENCY)")
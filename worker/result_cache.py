@@ -0,0 +1,173 @@
+import hashlib
+import os
+import time
+import uuid
+
+import executors
+
+# Deterministic-result cache, shared by every worker through Redis. Only handlers registered
+# with cacheable=True take part; the key covers (task_type, handler version, input_data).
+# Opt-in: with it on, identical tasks share one run, so per-task cancellation and timing change.
+RESULT_CACHE = os.getenv("RESULT_CACHE", "0") == "1"
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "3600")) # seconds a cached result stays valid
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000")) # least recently used beyond this are evicted
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", "65536")) # larger outputs are not cached
+CACHE_KEY = "result_cache:{}"
+CACHE_LOCK_KEY = "result_cache:lock:{}" # single-flight: held by the worker computing a key
+CACHE_LRU_KEY = "result_cache:lru" # zset: key -> last access time
+CACHE_STATS_KEY = "result_cache:stats" # hash: hits, misses, coalesced, fills, evictions
+
+# Store a result, record its access time and evict the least recently used overflow.
+# KEYS: entry, lru zset, stats. ARGV: value, ttl, now, max entries
+FILL_SCRIPT = """
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[3], KEYS[1])
+redis.call('HINCRBY', KEYS[3], 'fills', 1)
+local overflow = redis.call('ZCARD', KEYS[2]) - tonumber(ARGV[4])
+if overflow > 0 then
+    local oldest = redis.call('ZPOPMIN', KEYS[2], overflow)
+    for i = 1, #oldest, 2 do
+        redis.call('DEL', oldest[i])
+    end
+    redis.call('HINCRBY', KEYS[3], 'evictions', overflow)
+end
+return overflow
+"""
+
+# Release the single-flight lock only if we still own it
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+def cache_key(handler, input_data):
+    digest = hashlib.sha256(f"{handler.task_type}\0{handler.version}\0{input_data}".encode()).hexdigest()
+    return CACHE_KEY.format(digest)
+
+def record(r, stat):
+    try:
+        r.hincrby(CACHE_STATS_KEY, stat, 1)
+    except Exception as e:
+        print(f"Result cache stats error: {e}")
+
+class HitCall:
+    """A cache hit: already finished."""
+    def __init__(self, value):
+        self.value = value
+        self.started_at = time.time()
+
+    def wait(self, timeout):
+        return True
+
+    def result(self):
+        return self.value
+
+    def abort(self):
+        pass
+
+class LeaderCall:
+    """Runs the handler for everyone waiting on this key, fills the cache and releases the lock."""
+    def __init__(self, r, key, token, inner):
+        self.r = r
+        self.key = key
+        self.token = token
+        self.inner = inner
+
+    @property
+    def started_at(self):
+        return self.inner.started_at
+
+    def wait(self, timeout):
+        return self.inner.wait(timeout)
+
+    def result(self):
+        try:
+            value = self.inner.result()
+            if len(value.encode()) <= RESULT_CACHE_MAX_BYTES:
+                try:
+                    self.r.register_script(FILL_SCRIPT)(
+                        keys=[self.key, CACHE_LRU_KEY, CACHE_STATS_KEY],
+                        args=[value, RESULT_CACHE_TTL, time.time(), RESULT_CACHE_MAX_ENTRIES],
+                    )
+                except Exception as e:
+                    print(f"Result cache fill error: {e}")
+            return value
+        finally:
+            self.release()
+
+    def abort(self):
+        self.inner.abort()
+        self.release()
+
+    def release(self):
+        try:
+            self.r.register_script(RELEASE_SCRIPT)(keys=[CACHE_LOCK_KEY.format(self.key)], args=[self.token])
+        except Exception as e:
+            # The lock expires on its own; followers take over then
+            print(f"Result cache lock release error: {e}")
+
+class FollowerCall:
+    """Waits for an identical task running elsewhere; takes over if that run ends without a result."""
+    def __init__(self, r, key, handler, input_data, ctx, lock_ttl_ms):
+        self.r = r
+        self.key = key
+        self.run = (handler, input_data, ctx)
+        self.lock_ttl_ms = lock_ttl_ms
+        self.inner = None
+        self.value = None
+        self.started_at = time.time()
+
+    def wait(self, timeout):
+        if self.inner is not None:
+            return self.inner.wait(timeout)
+        time.sleep(timeout)
+        try:
+            value = self.r.get(self.key)
+            if value is not None:
+                self.value = value
+                record(self.r, "coalesced")
+                return True
+            if not self.r.exists(CACHE_LOCK_KEY.format(self.key)):
+                # The leader failed, timed out or produced an uncacheable result: run it ourselves
+                self.inner = try_lead(self.r, self.key, *self.run, self.lock_ttl_ms)
+        except Exception as e:
+            print(f"Result cache unavailable, running {self.run[0].task_type} uncached: {e}")
+            self.inner = executors.start_handler(*self.run)
+        if self.inner is not None:
+            self.started_at = self.inner.started_at or time.time()
+        return False
+
+    def result(self):
+        return self.inner.result() if self.inner is not None else self.value
+
+    def abort(self):
+        if self.inner is not None:
+            self.inner.abort()
+
+def try_lead(r, key, handler, input_data, ctx, lock_ttl_ms):
+    token = uuid.uuid4().hex
+    if not r.set(CACHE_LOCK_KEY.format(key), token, nx=True, px=lock_ttl_ms):
+        return None
+    return LeaderCall(r, key, token, executors.start_handler(handler, input_data, ctx))
+
+def start(r, handler, input_data, ctx, max_time):
+    """Like executors.start_handler, but served from / coalesced through the cache when the handler allows it."""
+    if not (RESULT_CACHE and handler.cacheable):
+        return executors.start_handler(handler, input_data, ctx)
+    key = cache_key(handler, input_data)
+    try:
+        value = r.get(key)
+        if value is not None:
+            r.zadd(CACHE_LRU_KEY, {key: time.time()}, xx=True)
+            record(r, "hits")
+            return HitCall(value)
+        record(r, "misses")
+        # The leader gives up by max_time at the latest, so the lock never needs to outlive that
+        lock_ttl_ms = int((max_time + 5) * 1000)
+        return try_lead(r, key, handler, input_data, ctx, lock_ttl_ms) or FollowerCall(r, key, handler, input_data, ctx, lock_ttl_ms)
+    except Exception as e:
+        # The cache is an optimisation: never fail a task because Redis hiccuped
+        print(f"Result cache unavailable, running {handler.task_type} uncached: {e}")
+        return executors.start_handler(handler, input_data, ctx)